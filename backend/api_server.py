@@ -707,9 +707,9 @@ async def remove_objects_from_group(group_id: int, request: GroupAddObjectsReque
             unclassified_id = db.ensure_unclassified_table()
             objects_to_classify = []
 
-            for obj_id in request.object_ids:
-                # Get all groups for this object
-                obj_groups = db.get_object_groups(obj_id)
+            # Fetch group memberships for all removed objects in one query
+            groups_by_object = db.get_groups_for_objects(request.object_ids)
+            for obj_id, obj_groups in groups_by_object.items():
                 # Check if any are table groups
                 has_table = any(g.get('group_name', '').startswith('Table ') for g in obj_groups)
                 if not has_table:
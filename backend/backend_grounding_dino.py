@@ -25,7 +25,7 @@ class GroundingDinoSystem:
     def __init__(self, detection_classes, endpoint=None, api_host="127.0.0.1", api_port=8000,
                  pan_tilt_port=None, ema_alpha=0.25,
                  confidence=0.60, resize_width=1920, jpeg_quality=100,
-                 movement_threshold=10.0):
+                 movement_threshold=10.0, adaptive_quality=False, target_latency=0.08):
         print("=" * 70)
         print("VISUAL DATABASE - GROUNDING DINO + DATABASE + API SERVER")
         print("=" * 70)
@@ -76,7 +76,9 @@ class GroundingDinoSystem:
                 endpoint=endpoint,
                 model='grounding-dino-tiny',
                 resize_width=resize_width,
-                jpeg_quality=jpeg_quality
+                jpeg_quality=jpeg_quality,
+                adaptive_quality=adaptive_quality,
+                target_latency=target_latency
             )
         except Exception as e:
             print(f"\n✗ ERROR: Failed to initialize detector")
@@ -183,12 +185,12 @@ class GroundingDinoSystem:
         self._start_keyboard_listener()
 
 
-    def process_frame(self, rgb_frame, depth_frame):
+    def process_frame(self, bgr_frame, depth_frame):
         # Get detections from remote Grounding DINO (async, non-blocking)
         # Returns (detections, is_new) - is_new is True only when fresh GPU results arrive
         # Pass current pan angle for world coordinate transformation
         detections, is_new_gpu_result = self.detector.detect_with_depth(
-            rgb_frame, depth_frame, self.kinect, pan_angle=self.current_pan
+            bgr_frame, depth_frame, self.kinect, pan_angle=self.current_pan
         )
 
         # Only process database when we have fresh GPU results
@@ -230,7 +232,7 @@ class GroundingDinoSystem:
 
             if action == 'add_to_db':
                 # Add to database (first time at this view) - create directly, no matching
-                new_object_id = self.db.create_object(det, rgb_frame)
+                new_object_id = self.db.create_object(det, bgr_frame)
 
                 if new_object_id is None:
                     continue
@@ -247,7 +249,7 @@ class GroundingDinoSystem:
 
             elif action == 'update_present':
                 # Object was absent, now present again - update existing entry
-                success = self.db.mark_object_present(object_id, det, rgb_frame)
+                success = self.db.mark_object_present(object_id, det, bgr_frame)
                 if success:
                     processed_object_ids.append(object_id)
                     # Reset home position (new appearance = new home)
@@ -257,7 +259,7 @@ class GroundingDinoSystem:
 
             elif action == 'update_data':
                 # Periodic refresh: update thumbnail, position, confidence
-                self.db.update_object(object_id, det, rgb_frame)
+                self.db.update_object(object_id, det, bgr_frame)
                 processed_object_ids.append(object_id)
                 self.objects_updated += 1
 
@@ -441,6 +443,14 @@ class GroundingDinoSystem:
         fps = 0.0
         fps_time = time.time()
 
+        # Display frames are downscaled into one reused buffer (imshow copies it)
+        display_buf = np.empty((720, 1280, 3), dtype=np.uint8)
+
+        # get_frames returns None until a new color frame arrives, so keep the last one
+        # for the frozen-view fallback and for capture. It is the Kinect's front buffer,
+        # which stays intact until get_frames swaps in a newer frame.
+        last_bgr = None
+
         # Set up mouse callback for re-labeling
         cv2.namedWindow('Grounding DINO: Detection + Database + API', cv2.WINDOW_NORMAL)
         cv2.setMouseCallback('Grounding DINO: Detection + Database + API', self.relabeling_system.mouse_callback)
@@ -454,22 +464,21 @@ class GroundingDinoSystem:
                     # Show re-labeling UI (updates continuously)
                     vis = self.relabeling_system.get_visualization()
                     if vis is None:
-                        if 'bgr_frame' in locals() and bgr_frame is not None:
-                            vis = bgr_frame.copy()
-                        elif 'rgb_frame' in locals() and rgb_frame is not None:
-                            vis = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2BGR)
+                        if last_bgr is not None:
+                            vis = last_bgr.copy()
                         else:
                             vis = np.zeros((1080, 1920, 3), dtype=np.uint8)
 
-                    vis_display = cv2.resize(vis, (1280, 720))
+                    vis_display = cv2.resize(vis, (1280, 720), dst=display_buf)
                     cv2.imshow('Grounding DINO: Detection + Database + API', vis_display)
 
                 elif not paused:
-                    rgb_frame, depth_frame = self.kinect.get_frames()
+                    # Kinect frames arrive in BGR order, ready for OpenCV and JPEG encoding
+                    bgr_frame, depth_frame = self.kinect.get_frames()
+                    if bgr_frame is not None:
+                        last_bgr = bgr_frame
 
-                    if rgb_frame is not None and depth_frame is not None:
-                        # Convert RGB to BGR for OpenCV visualization
-                        bgr_frame = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2BGR)
+                    if bgr_frame is not None and depth_frame is not None:
 
                         # Check if we're in servo cooldown period
                         time_since_servo_move = time.time() - self.last_servo_move_time
@@ -479,7 +488,7 @@ class GroundingDinoSystem:
                         if not in_cooldown:
                             # Process frame - non-blocking, returns cached results when GPU is busy
                             # This keeps video smooth at full FPS while GPU processes async
-                            detections, object_ids = self.process_frame(rgb_frame, depth_frame)
+                            detections, object_ids = self.process_frame(bgr_frame, depth_frame)
                         else:
                             # In cooldown - skip detection, use empty results
                             detections, object_ids = [], []
@@ -529,7 +538,7 @@ class GroundingDinoSystem:
                                        (10, 180),
                                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 165, 255), 2)
 
-                        vis_display = cv2.resize(vis, (1280, 720))
+                        vis_display = cv2.resize(vis, (1280, 720), dst=display_buf)
                         cv2.imshow('Grounding DINO: Detection + Database + API', vis_display)
 
                         # Show depth view if enabled
@@ -559,15 +568,15 @@ class GroundingDinoSystem:
                         paused_vis = vis.copy()
                         cv2.putText(paused_vis, "PAUSED", (paused_vis.shape[1]//2 - 100, 50),
                                    cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 255), 3)
-                        vis_display = cv2.resize(paused_vis, (1280, 720))
+                        vis_display = cv2.resize(paused_vis, (1280, 720), dst=display_buf)
                         cv2.imshow('Grounding DINO: Detection + Database + API', vis_display)
 
                 # Use waitKey for OpenCV window handling and non-arrow keys
                 key = cv2.waitKey(1) & 0xFF
 
-                # Update Tkinter GUI event loop
+                # Update Tkinter GUI event loop: update() drains pending events (idle tasks
+                # included) and returns, so Tk never busy-waits and stays on this thread
                 try:
-                    self.tk_root.update_idletasks()
                     self.tk_root.update()
                 except:
                     pass
@@ -585,8 +594,9 @@ class GroundingDinoSystem:
 
                 elif key == ord('S'):
                     # Uppercase 'S' - enter re-labeling mode
-                    if 'bgr_frame' in locals() and 'detections' in locals() and 'object_ids' in locals():
-                        self.relabeling_system.capture_frame(bgr_frame, detections, object_ids)
+                    if last_bgr is not None and 'detections' in locals() and 'object_ids' in locals():
+                        # Kept as a view: get_frames is not called again until the view resumes
+                        self.relabeling_system.capture_frame(last_bgr, detections, object_ids)
                         paused = True
 
                 elif key == ord('C'):
@@ -753,6 +763,10 @@ Examples:
                         help='Resize frames to this width for GPU upload (default: 1920 - full resolution)')
     parser.add_argument('--jpeg-quality', type=int, default=100,
                         help='JPEG quality for compression (1-100, default: 100 - maximum quality)')
+    parser.add_argument('--adaptive-quality', action='store_true',
+                        help='Adapt JPEG quality/upload width to network latency (--resize-width/--jpeg-quality are the maximums)')
+    parser.add_argument('--target-latency', type=float, default=80.0,
+                        help='Target GPU round-trip latency in ms for --adaptive-quality (default: 80)')
 
     # Movement detection (CV-based)
     parser.add_argument('--movement-threshold', type=float, default=10.0,
@@ -797,6 +811,8 @@ Examples:
     print(f"EMA alpha (position smoothing): {args.ema_alpha:.2f}")
     print(f"GPU upload resolution: {args.resize_width}px")
     print(f"JPEG quality: {args.jpeg_quality}%")
+    if args.adaptive_quality:
+        print(f"Adaptive quality: ON (target latency {args.target_latency:.0f}ms)")
     print(f"Movement threshold: {args.movement_threshold}% of frame dimensions")
     print("=" * 70)
 
@@ -810,7 +826,9 @@ Examples:
             confidence=args.confidence,
             resize_width=args.resize_width,
             jpeg_quality=args.jpeg_quality,
-            movement_threshold=args.movement_threshold
+            movement_threshold=args.movement_threshold,
+            adaptive_quality=args.adaptive_quality,
+            target_latency=args.target_latency / 1000.0
         )
         system.run()
 
@@ -1,28 +1,176 @@
 """Database layer for object persistence and tracking"""
 
 import sqlite3
+import threading
 import time
 import json
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, List, Dict, Tuple
+from functools import lru_cache, wraps
+from typing import Optional, List, Dict, Tuple, Iterator
 import numpy as np
 from io import BytesIO
 from PIL import Image
 
 
+# Columns that update_class() may modify
+_CLASS_UPDATE_ALLOWED = frozenset({
+    'name', 'category', 'color', 'icon', 'description',
+    'is_active', 'confidence_override', 'distance_threshold'
+})
+
+# Narrow id-only lookups used by the ensure_* paths
+_CLASS_ID_BY_NAME_SQL = "SELECT class_id FROM classes WHERE name = ?"
+_GROUP_ID_BY_NAME_SQL = "SELECT group_id FROM object_groups WHERE group_name = ?"
+
+
+def _compose_get_all_classes_sql(include_shadow: bool, active_only: bool,
+                                 has_category: bool) -> str:
+    query = "SELECT * FROM classes WHERE 1=1"
+    if not include_shadow:
+        query += " AND name != '__system_shadow_fallback__'"
+    if active_only:
+        query += " AND is_active = 1"
+    if has_category:
+        query += " AND category = ?"
+    return query + " ORDER BY name ASC"
+
+
+# get_all_classes() SQL for every (include_shadow, active_only, has_category) combination
+_GET_ALL_CLASSES_SQL = {
+    (include_shadow, active_only, has_category):
+        _compose_get_all_classes_sql(include_shadow, active_only, has_category)
+    for include_shadow in (False, True)
+    for active_only in (False, True)
+    for has_category in (False, True)
+}
+
+
+@lru_cache(maxsize=64)
+def _build_update_sql(table: str, fields: Tuple[str, ...], key_column: str) -> str:
+    """Build (once per field combination) an UPDATE that also stamps updated_at"""
+    assignments = ', '.join(f"{field} = ?" for field in fields)
+    return f"UPDATE {table} SET {assignments}, updated_at = ? WHERE {key_column} = ?"
+
+
+def _write(method):
+    """Run a write method under the connection-wide write lock (see transaction())"""
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._write_lock:
+            return method(self, *args, **kwargs)
+    return locked
+
 
 class VisualDatabase:
 
-    def __init__(self, db_path="visual_database.db", ema_alpha=0.25):
+    def __init__(self, db_path="visual_database.db", ema_alpha=0.25, wal_mode=True):
         self.db_path = db_path
         self.ema_alpha = ema_alpha  # Exponential Moving Average smoothing factor (0.0-1.0)
-        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level="DEFERRED")
+        self.wal_mode = wal_mode  # Disable for environments that need full fsync durability
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level="DEFERRED",
+                                    cached_statements=256)
         self.conn.row_factory = sqlite3.Row
 
+        # Per-thread cursor reused by single-row lookups (see _fetch_one)
+        self._local = threading.local()
+
+        # One connection is shared by every thread, so its transaction is too:
+        # write methods and transaction() blocks hold this lock while writing,
+        # so no other thread can commit (or roll back) another's writes
+        self._write_lock = threading.RLock()
+
+        # Cached ids of system rows resolved by the ensure_* methods
+        self._shadow_class_id: Optional[int] = None
+        self._unclassified_group_id: Optional[int] = None
+
+        self._configure_connection()
         self._create_tables()
 
         print(f"[OK] Database initialized: {db_path} (EMA alpha={ema_alpha:.2f})")
 
+    def _configure_connection(self):
+        """Apply connection-level PRAGMAs once at open"""
+        cursor = self.conn.cursor()
+
+        if self.wal_mode:
+            # WAL + NORMAL sync: commits append to the log without an fsync each time
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-20000")  # ~20MB page cache
+        cursor.execute("PRAGMA mmap_size=268435456")  # 256MB memory-mapped I/O
+
+    def _commit(self):
+        """Commit, unless the write is part of a caller-controlled transaction()"""
+        if not getattr(self._local, 'in_transaction', False):
+            self.conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run several write calls as one transaction (a single commit).
+        Write methods skip their own commit while inside the block:
+
+            with db.transaction():
+                group_id = db.create_group("Table 3")
+                db.add_objects_to_group(group_id, object_ids)
+
+        The write lock is held for the whole block, so writes from other
+        threads wait until it commits or rolls back.
+        Nested blocks join the outer transaction.
+        """
+        if getattr(self._local, 'in_transaction', False):
+            yield self
+            return
+
+        with self._write_lock:
+            # A write that failed mid-statement can leave sqlite3's implicit
+            # transaction open, and BEGIN cannot be nested; discard its partial writes
+            if self.conn.in_transaction:
+                print("⚠ Rolling back a transaction left open by a failed write")
+                self.conn.rollback()
+
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._local.in_transaction = True
+            try:
+                yield self
+            except BaseException:
+                self.conn.rollback()
+                # Ids cached inside the rolled-back block may no longer exist
+                self._shadow_class_id = None
+                self._unclassified_group_id = None
+                raise
+            else:
+                self.conn.commit()
+            finally:
+                self._local.in_transaction = False
+
+    def _fetch_one(self, query: str, params=()) -> Optional[Dict]:
+        """
+        Run a single-row lookup on a cursor reused per thread.
+        Only used by leaf lookups that fully consume their result and never call
+        back into the database, so the shared cursor is never re-entered.
+        """
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self.conn.cursor()
+        rows = cursor.execute(query, params).fetchall()
+        return dict(rows[0]) if rows else None
+
+    def _query_dicts(self, query: str, params=()) -> List[Dict]:
+        """
+        Run a read query and return its rows as dicts.
+        Rows are fetched as plain tuples and zipped with column names resolved
+        once per query, instead of building an sqlite3.Row and then a dict per row.
+        """
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(query, params)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
     def _create_tables(self):
         cursor = self.conn.cursor()
 
@@ -205,6 +353,10 @@ class VisualDatabase:
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_group_name ON object_groups(group_name)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_group_members_group ON object_group_members(group_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_group_members_object ON object_group_members(object_id)")
+        # Covering index for membership joins that filter by object and join on group
+        # (get_object_groups, delete_group, assign_unclassified_objects_to_table).
+        # The (group_id, object_id) direction is already covered by the UNIQUE constraint.
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_group_members_object_group ON object_group_members(object_id, group_id)")
 
 
         self.conn.commit()
@@ -228,7 +380,7 @@ class VisualDatabase:
         return np.array(pil_img)
 
 
-    def _extract_thumbnail(self, rgb_frame: np.ndarray, bbox: Tuple[int, int, int, int],
+    def _extract_thumbnail(self, bgr_frame: np.ndarray, bbox: Tuple[int, int, int, int],
                           target_size: Tuple[int, int] = (128, 128)) -> bytes:
         """
         Extract thumbnail from bbox region.
@@ -237,14 +389,14 @@ class VisualDatabase:
         x, y, w, h = bbox
 
         # Ensure bbox is within image bounds
-        h_img, w_img = rgb_frame.shape[:2]
+        h_img, w_img = bgr_frame.shape[:2]
         x = max(0, x)
         y = max(0, y)
         w = min(w, w_img - x)
         h = min(h, h_img - y)
 
-        # Crop object
-        cropped = rgb_frame[y:y+h, x:x+w]
+        # Crop object (BGR -> RGB for PIL, only on the cropped region)
+        cropped = np.ascontiguousarray(bgr_frame[y:y+h, x:x+w, ::-1])
 
         # Resize to thumbnail
         pil_img = Image.fromarray(cropped)
@@ -258,7 +410,8 @@ class VisualDatabase:
         return thumbnail_blob
 
 
-    def create_object(self, detection: Dict, rgb_frame: Optional[np.ndarray] = None) -> Optional[int]:
+    @_write
+    def create_object(self, detection: Dict, bgr_frame: Optional[np.ndarray] = None) -> Optional[int]:
         cursor = self.conn.cursor()
 
         # ALWAYS-TRACK MODE: Accept objects even with estimated positions
@@ -292,9 +445,9 @@ class VisualDatabase:
 
         # Extract thumbnail if frame provided
         thumbnail = None
-        if rgb_frame is not None and 'bbox' in detection:
+        if bgr_frame is not None and 'bbox' in detection:
             try:
-                thumbnail = self._extract_thumbnail(rgb_frame, detection['bbox'])
+                thumbnail = self._extract_thumbnail(bgr_frame, detection['bbox'])
             except Exception as e:
                 print(f"Warning: Failed to extract thumbnail: {e}")
 
@@ -332,7 +485,7 @@ class VisualDatabase:
         # Record detection event (with actual center_3d, may be None)
         self._record_detection(object_id, detection)
 
-        self.conn.commit()
+        self._commit()
         
         if depth_source == 'estimated':
             print(f"  ℹ Created object {object_id} with ESTIMATED position (will update when real depth available)")
@@ -341,8 +494,9 @@ class VisualDatabase:
 
         return object_id
 
+    @_write
     def update_object(self, object_id: int, detection: Dict,
-                     rgb_frame: Optional[np.ndarray] = None):
+                     bgr_frame: Optional[np.ndarray] = None):
         cursor = self.conn.cursor()
 
         # Get current object data
@@ -373,7 +527,7 @@ class VisualDatabase:
                 WHERE object_id = ?
             """, (datetime.now().isoformat(), object_id))
             self._record_detection(object_id, detection)
-            self.conn.commit()
+            self._commit()
             return
 
         # Check if this is first real depth after estimated position
@@ -413,14 +567,14 @@ class VisualDatabase:
             awaiting_real_depth = obj.get('awaiting_real_depth', 1)
             last_real_depth_time = obj.get('last_real_depth_time')
 
-        # Update thumbnail if rgb_frame provided (used for periodic updates)
+        # Update thumbnail if bgr_frame provided (used for periodic updates)
         thumbnail_update = ""
         thumbnail_params = []
-        if rgb_frame is not None:
+        if bgr_frame is not None:
             try:
-                thumbnail = self._extract_thumbnail(rgb_frame, detection['bbox'])
+                thumbnail = self._extract_thumbnail(bgr_frame, detection['bbox'])
                 thumbnail_update = ", thumbnail = ?, thumbnail_updated = ?"
-                thumbnail_params = [thumbnail, datetime.now().isoformat()]
+                thumbnail_params = [thumbnail, now]
             except Exception as e:
                 print(f"Warning: Failed to update thumbnail: {e}")
 
@@ -451,7 +605,7 @@ class VisualDatabase:
         # Record detection event (with actual center_3d, may be None)
         self._record_detection(object_id, detection)
 
-        self.conn.commit()
+        self._commit()
 
         # Update object
         now = datetime.now().isoformat()
@@ -475,7 +629,7 @@ class VisualDatabase:
         # Record detection event (with actual center_3d, may be None)
         self._record_detection(object_id, detection)
 
-        self.conn.commit()
+        self._commit()
 
     def _record_detection(self, object_id: int, detection: Dict):
         cursor = self.conn.cursor()
@@ -502,10 +656,26 @@ class VisualDatabase:
 
 
     def get_object(self, object_id: int) -> Optional[Dict]:
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM objects WHERE object_id = ?", (object_id,))
-        row = cursor.fetchone()
-        return dict(row) if row else None
+        return self._fetch_one("SELECT * FROM objects WHERE object_id = ?", (object_id,))
+
+    def get_objects(self, object_ids: List[int]) -> Dict[int, Dict]:
+        """
+        Get several objects in a single query.
+
+        Args:
+            object_ids: List of object IDs
+
+        Returns:
+            Dict mapping each found object_id to its object dictionary
+            (missing IDs are simply absent)
+        """
+        if not object_ids:
+            return {}
+
+        rows = self._query_dicts(
+            "SELECT * FROM objects WHERE object_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(object_ids)),))
+        return {row['object_id']: row for row in rows}
 
     def get_all_objects(self, present_only: bool = False,
                        class_name: Optional[str] = None,
@@ -657,6 +827,7 @@ class VisualDatabase:
         """, (limit,))
         return [dict(row) for row in cursor.fetchall()]
 
+    @_write
     def mark_absent_objects(self, timeout_seconds: float = 30.0):
         """
         Mark objects as absent if not seen for timeout_seconds.
@@ -671,9 +842,10 @@ class VisualDatabase:
             WHERE last_seen < ? AND is_present = 1
         """, (threshold_time,))
 
-        self.conn.commit()
+        self._commit()
         return cursor.rowcount
 
+    @_write
     def mark_object_absent(self, object_id: int):
         """
         Mark a specific object as absent.
@@ -686,17 +858,18 @@ class VisualDatabase:
             UPDATE objects SET is_present = 0
             WHERE object_id = ?
         """, (object_id,))
-        self.conn.commit()
+        self._commit()
         return cursor.rowcount > 0
 
-    def mark_object_present(self, object_id: int, detection: Optional[Dict] = None, rgb_frame: Optional[np.ndarray] = None):
+    @_write
+    def mark_object_present(self, object_id: int, detection: Optional[Dict] = None, bgr_frame: Optional[np.ndarray] = None):
         """
         Mark a specific object as present and optionally update its data.
 
         Args:
             object_id: Database object ID to mark as present
             detection: Optional detection dict to update position/confidence
-            rgb_frame: Optional RGB frame for thumbnail update
+            bgr_frame: Optional BGR frame for thumbnail update
         """
         cursor = self.conn.cursor()
 
@@ -706,7 +879,7 @@ class VisualDatabase:
                 UPDATE objects SET is_present = 1, last_seen = ?
                 WHERE object_id = ?
             """, (datetime.now().isoformat(), object_id))
-            self.conn.commit()
+            self._commit()
             return cursor.rowcount > 0
 
         # Mark present and update with detection data
@@ -737,7 +910,7 @@ class VisualDatabase:
                 WHERE object_id = ?
             """, (datetime.now().isoformat(), object_id))
             self._record_detection(object_id, detection)
-            self.conn.commit()
+            self._commit()
             return True
 
         # Check if this is first real depth after estimated position
@@ -803,7 +976,7 @@ class VisualDatabase:
         # Record detection event (with actual center_3d, may be None)
         self._record_detection(object_id, detection)
 
-        self.conn.commit()
+        self._commit()
         return True
         
         # Determine which position to use
@@ -820,7 +993,7 @@ class VisualDatabase:
                 WHERE object_id = ?
             """, (datetime.now().isoformat(), object_id))
             self._record_detection(object_id, detection)
-            self.conn.commit()
+            self._commit()
             return True
 
         # Update position using EMA
@@ -862,16 +1035,18 @@ class VisualDatabase:
         # Record detection event (with actual center_3d, may be None)
         self._record_detection(object_id, detection)
 
-        self.conn.commit()
+        self._commit()
         return True
 
+    @_write
     def delete_object(self, object_id: int):
         cursor = self.conn.cursor()
         cursor.execute("DELETE FROM objects WHERE object_id = ?", (object_id,))
-        self.conn.commit()
+        self._commit()
 
     # === MOVEMENT TRACKING METHODS ===
 
+    @_write
     def set_home_position(self, object_id: int, bbox: Tuple[int, int, int, int]):
         """
         Set the home position (initial bounding box) for an object.
@@ -892,8 +1067,9 @@ class VisualDatabase:
                 behavioral_state = 'PRESENT'
             WHERE object_id = ?
         """, (x, y, w, h, object_id))
-        self.conn.commit()
+        self._commit()
 
+    @_write
     def update_movement_state(self, object_id: int, is_moved: bool,
                               behavioral_state: str = None):
         """
@@ -940,8 +1116,9 @@ class VisualDatabase:
                 WHERE object_id = ?
             """, (1 if is_moved else 0, object_id))
 
-        self.conn.commit()
+        self._commit()
 
+    @_write
     def set_behavioral_state(self, object_id: int, state: str):
         """
         Set the behavioral state for an object.
@@ -956,7 +1133,23 @@ class VisualDatabase:
             UPDATE objects SET behavioral_state = ?
             WHERE object_id = ?
         """, (state, object_id))
-        self.conn.commit()
+        self._commit()
+
+    @_write
+    def update_object_class(self, object_id: int, class_name: str) -> bool:
+        """
+        Relabel an object (set its class_name).
+
+        Returns:
+            True if the object exists
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            UPDATE objects SET class_name = ?
+            WHERE object_id = ?
+        """, (class_name, object_id))
+        self._commit()
+        return cursor.rowcount > 0
 
     def get_home_position(self, object_id: int) -> Optional[Tuple[int, int, int, int]]:
         """
@@ -1004,6 +1197,7 @@ class VisualDatabase:
 
     # === BEHAVIORAL EVENTS METHODS ===
 
+    @_write
     def record_behavioral_event(self, object_id: int, class_name: str, event_type: str,
                                 view_angle: int = None, metadata: Dict = None) -> int:
         """
@@ -1030,7 +1224,7 @@ class VisualDatabase:
         """, (object_id, class_name, event_type, view_angle, now, metadata_json))
 
         event_id = cursor.lastrowid
-        self.conn.commit()
+        self._commit()
 
         return event_id
 
@@ -1121,6 +1315,7 @@ class VisualDatabase:
             'by_type': event_counts
         }
 
+    @_write
     def clear_behavioral_events(self, before: str = None):
         """
         Clear behavioral events.
@@ -1135,19 +1330,24 @@ class VisualDatabase:
         else:
             cursor.execute("DELETE FROM behavioral_events")
 
-        self.conn.commit()
+        self._commit()
 
     # === CLASS MANAGEMENT METHODS ===
 
+    @_write
     def create_class(self, name: str, category: Optional[str] = None,
                     color: Optional[str] = None, icon: Optional[str] = None,
                     description: Optional[str] = None,
                     confidence_override: Optional[float] = None,
-                    distance_threshold: Optional[float] = None) -> int:
-        """Create a new class definition"""
+                    distance_threshold: Optional[float] = None,
+                    now: Optional[str] = None) -> int:
+        """
+        Create a new class definition
+        now: optional ISO timestamp, so batch callers can share one per call
+        """
         cursor = self.conn.cursor()
 
-        now = datetime.now().isoformat()
+        now = now or datetime.now().isoformat()
         cursor.execute("""
             INSERT INTO classes (
                 name, category, color, icon, description,
@@ -1158,88 +1358,58 @@ class VisualDatabase:
               confidence_override, distance_threshold, now, now))
 
         class_id = cursor.lastrowid
-        self.conn.commit()
+        self._commit()
 
         # Update existing objects with this class name
         cursor.execute("""
             UPDATE objects SET class_id = ? WHERE class_name = ? AND class_id IS NULL
         """, (class_id, name))
-        self.conn.commit()
+        self._commit()
 
         return class_id
 
     def get_class(self, class_id: int) -> Optional[Dict]:
         """Get a class by ID"""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM classes WHERE class_id = ?", (class_id,))
-        row = cursor.fetchone()
-        return dict(row) if row else None
+        return self._fetch_one("SELECT * FROM classes WHERE class_id = ?", (class_id,))
 
     def get_class_by_name(self, name: str) -> Optional[Dict]:
         """Get a class by name"""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM classes WHERE name = ?", (name,))
-        row = cursor.fetchone()
-        return dict(row) if row else None
+        return self._fetch_one("SELECT * FROM classes WHERE name = ?", (name,))
 
     def get_all_classes(self, active_only: bool = False,
                        category: Optional[str] = None,
                        include_shadow: bool = False) -> List[Dict]:
         """Get all classes with optional filters"""
-        cursor = self.conn.cursor()
-
-        query = "SELECT * FROM classes WHERE 1=1"
-        params = []
+        # Shadow class is filtered out unless explicitly requested
+        query = _GET_ALL_CLASSES_SQL[(bool(include_shadow), bool(active_only), bool(category))]
+        params = (category,) if category else ()
 
-        # Always filter out shadow class unless explicitly requested
-        if not include_shadow:
-            query += " AND name != '__system_shadow_fallback__'"
-
-        if active_only:
-            query += " AND is_active = 1"
-
-        if category:
-            query += " AND category = ?"
-            params.append(category)
-
-        query += " ORDER BY name ASC"
-
-        cursor.execute(query, params)
-        return [dict(row) for row in cursor.fetchall()]
+        return self._query_dicts(query, params)
 
     def is_shadow_class(self, class_name: str) -> bool:
         """Check if a class name is the shadow fallback class"""
         return class_name == '__system_shadow_fallback__'
 
+    @_write
     def update_class(self, class_id: int, **kwargs) -> bool:
         """Update a class (supports partial updates)"""
         cursor = self.conn.cursor()
 
-        # Build dynamic UPDATE query
-        allowed_fields = ['name', 'category', 'color', 'icon', 'description',
-                         'is_active', 'confidence_override', 'distance_threshold']
-        updates = []
-        values = []
-
-        for field, value in kwargs.items():
-            if field in allowed_fields:
-                updates.append(f"{field} = ?")
-                values.append(value)
-
-        if not updates:
+        # Sorted field tuple keys the cached UPDATE statement
+        fields = tuple(sorted(field for field in kwargs if field in _CLASS_UPDATE_ALLOWED))
+        if not fields:
             return False
 
-        # Add updated_at timestamp
-        updates.append("updated_at = ?")
+        values = [kwargs[field] for field in fields]
         values.append(datetime.now().isoformat())
         values.append(class_id)
 
-        query = f"UPDATE classes SET {', '.join(updates)} WHERE class_id = ?"
-        cursor.execute(query, values)
-        self.conn.commit()
+        cursor.execute(_build_update_sql('classes', fields, 'class_id'), values)
+        self._commit()
 
         return cursor.rowcount > 0
 
+    @_write
     def delete_class(self, class_id: int, cascade: bool = False) -> bool:
         """
         Delete a class
@@ -1248,29 +1418,37 @@ class VisualDatabase:
         """
         cursor = self.conn.cursor()
 
-        # Prevent deletion of shadow class
-        cls = self.get_class(class_id)
-        if cls and self.is_shadow_class(cls['name']):
-            raise ValueError("Cannot delete system shadow class")
+        # Delete the class first; the guard prevents deletion of the shadow class
+        cursor.execute("""
+            DELETE FROM classes WHERE class_id = ? AND name != '__system_shadow_fallback__'
+        """, (class_id,))
+
+        if cursor.rowcount == 0:
+            # Only the failure path pays for the extra lookup
+            if self._fetch_one("""
+                SELECT 1 FROM classes WHERE class_id = ? AND name = '__system_shadow_fallback__'
+            """, (class_id,)):
+                raise ValueError("Cannot delete system shadow class")
+            return False
 
         if cascade:
-            # Delete objects first (CASCADE handled by FK constraint)
+            # Delete objects (CASCADE handled by FK constraint)
             cursor.execute("DELETE FROM objects WHERE class_id = ?", (class_id,))
         else:
             # Unlink objects
             cursor.execute("UPDATE objects SET class_id = NULL WHERE class_id = ?", (class_id,))
 
-        cursor.execute("DELETE FROM classes WHERE class_id = ?", (class_id,))
-        self.conn.commit()
+        self._commit()
 
-        return cursor.rowcount > 0
+        return True
 
     def bulk_create_classes(self, classes: List[Dict]) -> List[int]:
         """Bulk create multiple classes"""
         class_ids = []
+        now = datetime.now().isoformat()
         for cls in classes:
             try:
-                class_id = self.create_class(**cls)
+                class_id = self.create_class(**cls, now=now)
                 class_ids.append(class_id)
             except sqlite3.IntegrityError:
                 # Class already exists, skip
@@ -1279,18 +1457,23 @@ class VisualDatabase:
                     class_ids.append(existing['class_id'])
         return class_ids
 
+    @_write
     def ensure_shadow_class(self) -> int:
         """
         Ensure shadow fallback class exists. This is a hidden class that prevents
         the system from failing when no user classes are defined. It detects an
         object that will never realistically be found.
         """
+        if self._shadow_class_id is not None:
+            return self._shadow_class_id
+
         shadow_name = '__system_shadow_fallback__'
 
         # Check if shadow class already exists
-        existing = self.get_class_by_name(shadow_name)
+        existing = self._fetch_one(_CLASS_ID_BY_NAME_SQL, (shadow_name,))
         if existing:
-            return existing['class_id']
+            self._shadow_class_id = existing['class_id']
+            return self._shadow_class_id
 
         # Create shadow class
         try:
@@ -1303,50 +1486,42 @@ class VisualDatabase:
                 distance_threshold=150.0
             )
             print(f"✓ Created shadow fallback class (hidden from UI)")
+            self._shadow_class_id = class_id
             return class_id
         except sqlite3.IntegrityError:
             # Race condition - another process created it
-            existing = self.get_class_by_name(shadow_name)
-            return existing['class_id'] if existing else None
+            existing = self._fetch_one(_CLASS_ID_BY_NAME_SQL, (shadow_name,))
+            self._shadow_class_id = existing['class_id'] if existing else None
+            return self._shadow_class_id
 
 
     def get_class_statistics(self, class_id: int) -> Dict:
         """Get statistics for a specific class"""
         cursor = self.conn.cursor()
 
-        # Count objects
+        # Object counts, average confidence and detection total in one round-trip
         cursor.execute("""
             SELECT COUNT(*) as count,
-                   COUNT(CASE WHEN is_present = 1 THEN 1 END) as present_count
+                   COUNT(CASE WHEN is_present = 1 THEN 1 END) as present_count,
+                   AVG(avg_confidence) as avg_conf,
+                   (SELECT COUNT(*)
+                    FROM detections d
+                    JOIN objects o ON d.object_id = o.object_id
+                    WHERE o.class_id = ?) as detection_count
             FROM objects WHERE class_id = ?
-        """, (class_id,))
-        counts = cursor.fetchone()
-
-        # Total detections
-        cursor.execute("""
-            SELECT COUNT(*) as detection_count
-            FROM detections d
-            JOIN objects o ON d.object_id = o.object_id
-            WHERE o.class_id = ?
-        """, (class_id,))
-        detection_count = cursor.fetchone()['detection_count']
-
-        # Average confidence
-        cursor.execute("""
-            SELECT AVG(avg_confidence) as avg_conf
-            FROM objects WHERE class_id = ?
-        """, (class_id,))
-        avg_conf = cursor.fetchone()['avg_conf']
+        """, (class_id, class_id))
+        stats = cursor.fetchone()
 
         return {
-            'total_objects': counts['count'],
-            'present_objects': counts['present_count'],
-            'total_detections': detection_count,
-            'average_confidence': avg_conf
+            'total_objects': stats['count'],
+            'present_objects': stats['present_count'],
+            'total_detections': stats['detection_count'],
+            'average_confidence': stats['avg_conf']
         }
 
     # === GROUP MANAGEMENT METHODS ===
 
+    @_write
     def ensure_unclassified_table(self) -> int:
         """
         Ensure the Unclassified table exists and return its ID.
@@ -1355,12 +1530,16 @@ class VisualDatabase:
         Returns:
             group_id of the Unclassified table
         """
+        if self._unclassified_group_id is not None:
+            return self._unclassified_group_id
+
         unclassified_name = "Unclassified"
 
         # Check if Unclassified table exists
-        existing = self.get_group_by_name(unclassified_name)
+        existing = self._fetch_one(_GROUP_ID_BY_NAME_SQL, (unclassified_name,))
         if existing:
-            return existing['group_id']
+            self._unclassified_group_id = existing['group_id']
+            return self._unclassified_group_id
 
         # Create Unclassified table
         try:
@@ -1369,12 +1548,15 @@ class VisualDatabase:
                 description="Default table for unassigned objects"
             )
             print(f"✓ Created Unclassified table (ID {group_id})")
+            self._unclassified_group_id = group_id
             return group_id
         except Exception as e:
             # Race condition - another process created it
-            existing = self.get_group_by_name(unclassified_name)
-            return existing['group_id'] if existing else None
+            existing = self._fetch_one(_GROUP_ID_BY_NAME_SQL, (unclassified_name,))
+            self._unclassified_group_id = existing['group_id'] if existing else None
+            return self._unclassified_group_id
 
+    @_write
     def assign_unclassified_objects_to_table(self) -> int:
         """
         Find all objects not in any table group and assign them to Unclassified.
@@ -1387,30 +1569,30 @@ class VisualDatabase:
         # Ensure Unclassified table exists
         unclassified_id = self.ensure_unclassified_table()
 
-        # Get all objects
-        cursor.execute("SELECT object_id FROM objects")
-        all_objects = [row['object_id'] for row in cursor.fetchall()]
-
-        # Get objects already in table groups (groups starting with "Table" or "Unclassified")
+        # Insert every object that is not yet in a table group (groups starting
+        # with "Table" or "Unclassified") in a single statement
         cursor.execute("""
-            SELECT DISTINCT ogm.object_id
-            FROM object_group_members ogm
-            JOIN object_groups og ON ogm.group_id = og.group_id
-            WHERE og.group_name LIKE 'Table %' OR og.group_name = 'Unclassified'
-        """)
-        classified_objects = [row['object_id'] for row in cursor.fetchall()]
+            INSERT OR IGNORE INTO object_group_members (group_id, object_id, added_at)
+            SELECT ?, o.object_id, ?
+            FROM objects o
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM object_group_members ogm
+                JOIN object_groups og ON ogm.group_id = og.group_id
+                WHERE ogm.object_id = o.object_id
+                AND (og.group_name LIKE 'Table %' OR og.group_name = 'Unclassified')
+            )
+        """, (unclassified_id, datetime.now().isoformat()))
 
-        # Find unclassified objects
-        unclassified_objects = [obj_id for obj_id in all_objects if obj_id not in classified_objects]
+        added = cursor.rowcount
+        self._commit()
 
-        if unclassified_objects:
-            # Assign to Unclassified table
-            added = self.add_objects_to_group(unclassified_id, unclassified_objects)
+        if added > 0:
             print(f"✓ Assigned {added} object(s) to Unclassified table")
-            return added
 
-        return 0
+        return added
 
+    @_write
     def create_group(self, group_name: str, description: Optional[str] = None) -> int:
         """
         Create a new object group.
@@ -1430,9 +1612,28 @@ class VisualDatabase:
         """, (group_name, description, now, now))
 
         group_id = cursor.lastrowid
-        self.conn.commit()
+        self._commit()
         return group_id
 
+    def create_group_with_members(self, group_name: str, object_ids: List[int],
+                                  description: Optional[str] = None) -> int:
+        """
+        Create a new object group and add objects to it in one transaction.
+
+        Args:
+            group_name: Unique name for the group
+            object_ids: List of object IDs to add
+            description: Optional description
+
+        Returns:
+            group_id of the created group
+        """
+        with self.transaction():
+            group_id = self.create_group(group_name, description)
+            self.add_objects_to_group(group_id, object_ids)
+        return group_id
+
+    @_write
     def add_objects_to_group(self, group_id: int, object_ids: List[int]) -> int:
         """
         Add multiple objects to a group.
@@ -1445,23 +1646,19 @@ class VisualDatabase:
             Number of objects successfully added
         """
         cursor = self.conn.cursor()
-        added_count = 0
         now = datetime.now().isoformat()
 
-        for object_id in object_ids:
-            try:
-                cursor.execute("""
-                    INSERT INTO object_group_members (group_id, object_id, added_at)
-                    VALUES (?, ?, ?)
-                """, (group_id, object_id, now))
-                added_count += 1
-            except sqlite3.IntegrityError:
-                # Object already in group, skip
-                pass
+        # Objects already in the group are skipped by OR IGNORE
+        cursor.executemany("""
+            INSERT OR IGNORE INTO object_group_members (group_id, object_id, added_at)
+            VALUES (?, ?, ?)
+        """, [(group_id, object_id, now) for object_id in object_ids])
 
-        self.conn.commit()
+        added_count = max(cursor.rowcount, 0)
+        self._commit()
         return added_count
 
+    @_write
     def remove_objects_from_group(self, group_id: int, object_ids: List[int]) -> int:
         """
         Remove objects from a group.
@@ -1474,35 +1671,26 @@ class VisualDatabase:
             Number of objects successfully removed
         """
         cursor = self.conn.cursor()
-        placeholders = ','.join('?' * len(object_ids))
-        cursor.execute(f"""
+        cursor.execute("""
             DELETE FROM object_group_members
-            WHERE group_id = ? AND object_id IN ({placeholders})
-        """, [group_id] + object_ids)
+            WHERE group_id = ? AND object_id IN (SELECT value FROM json_each(?))
+        """, (group_id, json.dumps(list(object_ids))))
 
         removed_count = cursor.rowcount
-        self.conn.commit()
+        self._commit()
         return removed_count
 
     def get_group(self, group_id: int) -> Optional[Dict]:
         """Get a group by ID."""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM object_groups WHERE group_id = ?", (group_id,))
-        row = cursor.fetchone()
-        return dict(row) if row else None
+        return self._fetch_one("SELECT * FROM object_groups WHERE group_id = ?", (group_id,))
 
     def get_group_by_name(self, group_name: str) -> Optional[Dict]:
         """Get a group by name."""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM object_groups WHERE group_name = ?", (group_name,))
-        row = cursor.fetchone()
-        return dict(row) if row else None
+        return self._fetch_one("SELECT * FROM object_groups WHERE group_name = ?", (group_name,))
 
     def get_all_groups(self) -> List[Dict]:
         """Get all groups."""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM object_groups ORDER BY group_name ASC")
-        return [dict(row) for row in cursor.fetchall()]
+        return self._query_dicts("SELECT * FROM object_groups ORDER BY group_name ASC")
 
     def get_group_members(self, group_id: int) -> List[Dict]:
         """
@@ -1514,7 +1702,21 @@ class VisualDatabase:
         Returns:
             List of object dictionaries (excluding thumbnail for JSON compatibility)
         """
+        return list(self.iter_group_members(group_id))
+
+    def iter_group_members(self, group_id: int) -> Iterator[Dict]:
+        """
+        Stream the objects in a group without materializing the full result.
+
+        Args:
+            group_id: ID of the group
+
+        Yields:
+            Object dictionaries (same shape as get_group_members)
+        """
         cursor = self.conn.cursor()
+        cursor.row_factory = None
+        cursor.arraysize = 256
         cursor.execute("""
             SELECT o.object_id, o.class_name, o.avg_position_x, o.avg_position_y,
                    o.avg_position_z, o.first_seen, o.last_seen, o.detection_count,
@@ -1525,7 +1727,10 @@ class VisualDatabase:
             WHERE m.group_id = ?
             ORDER BY m.added_at DESC
         """, (group_id,))
-        return [dict(row) for row in cursor.fetchall()]
+
+        names = [column[0] for column in cursor.description]
+        for row in cursor:
+            yield dict(zip(names, row))
 
     def get_object_groups(self, object_id: int) -> List[Dict]:
         """
@@ -1537,16 +1742,77 @@ class VisualDatabase:
         Returns:
             List of group dictionaries
         """
-        cursor = self.conn.cursor()
-        cursor.execute("""
+        return self._query_dicts("""
             SELECT g.*, m.added_at
             FROM object_groups g
             JOIN object_group_members m ON g.group_id = m.group_id
             WHERE m.object_id = ?
             ORDER BY g.group_name ASC
         """, (object_id,))
-        return [dict(row) for row in cursor.fetchall()]
 
+    def get_members_for_groups(self, group_ids: List[int]) -> Dict[int, List[Dict]]:
+        """
+        Get the members of several groups in a single query.
+
+        Args:
+            group_ids: List of group IDs
+
+        Returns:
+            Dict mapping each group_id to its list of object dictionaries
+            (same shape as get_group_members)
+        """
+        members = {group_id: [] for group_id in group_ids}
+        if not group_ids:
+            return members
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT m.group_id AS member_group_id,
+                   o.object_id, o.class_name, o.avg_position_x, o.avg_position_y,
+                   o.avg_position_z, o.first_seen, o.last_seen, o.detection_count,
+                   o.avg_confidence, o.thumbnail_updated, o.is_present, o.class_id,
+                   m.added_at as group_added_at
+            FROM objects o
+            JOIN object_group_members m ON o.object_id = m.object_id
+            WHERE m.group_id IN (SELECT value FROM json_each(?))
+            ORDER BY m.added_at DESC
+        """, (json.dumps(list(group_ids)),))
+
+        for row in cursor.fetchall():
+            member = dict(row)
+            members[member.pop('member_group_id')].append(member)
+        return members
+
+    def get_groups_for_objects(self, object_ids: List[int]) -> Dict[int, List[Dict]]:
+        """
+        Get the groups of several objects in a single query.
+
+        Args:
+            object_ids: List of object IDs
+
+        Returns:
+            Dict mapping each object_id to its list of group dictionaries
+            (same shape as get_object_groups)
+        """
+        groups = {object_id: [] for object_id in object_ids}
+        if not object_ids:
+            return groups
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT m.object_id AS member_object_id, g.*, m.added_at
+            FROM object_groups g
+            JOIN object_group_members m ON g.group_id = m.group_id
+            WHERE m.object_id IN (SELECT value FROM json_each(?))
+            ORDER BY g.group_name ASC
+        """, (json.dumps(list(object_ids)),))
+
+        for row in cursor.fetchall():
+            group = dict(row)
+            groups[group.pop('member_object_id')].append(group)
+        return groups
+
+    @_write
     def delete_group(self, group_id: int) -> bool:
         """
         Delete a group and reassign objects to Unclassified if needed.
@@ -1577,25 +1843,23 @@ class VisualDatabase:
         # If this is a table group, check each object's table memberships
         if group_name.startswith('Table ') or group_name == 'Unclassified':
             if group_name != 'Unclassified' and object_ids:
-                # For each object, check if it's in any other table groups
-                objects_needing_unclassified = []
-
-                for obj_id in object_ids:
-                    # Count how many table groups this object is in (excluding this one)
-                    cursor.execute("""
-                        SELECT COUNT(*) as count
-                        FROM object_group_members ogm
-                        JOIN object_groups og ON ogm.group_id = og.group_id
-                        WHERE ogm.object_id = ?
-                        AND ogm.group_id != ?
-                        AND (og.group_name LIKE 'Table %' OR og.group_name = 'Unclassified')
-                    """, (obj_id, group_id))
-
-                    count = cursor.fetchone()['count']
-
-                    # If object is not in any other table, it needs to go to Unclassified
-                    if count == 0:
-                        objects_needing_unclassified.append(obj_id)
+                # Count the other table groups of every object in one query
+                # (served by idx_group_members_object_group)
+                cursor.execute("""
+                    SELECT ogm.object_id, COUNT(*) as count
+                    FROM object_group_members ogm
+                    JOIN object_groups og ON ogm.group_id = og.group_id
+                    WHERE ogm.object_id IN (SELECT value FROM json_each(?))
+                    AND ogm.group_id != ?
+                    AND (og.group_name LIKE 'Table %' OR og.group_name = 'Unclassified')
+                    GROUP BY ogm.object_id
+                """, (json.dumps(object_ids), group_id))
+                in_other_tables = {row['object_id'] for row in cursor.fetchall()}
+
+                # Objects not in any other table need to go to Unclassified
+                objects_needing_unclassified = [
+                    obj_id for obj_id in object_ids if obj_id not in in_other_tables
+                ]
 
                 # Add orphaned objects to Unclassified
                 if objects_needing_unclassified:
@@ -1610,9 +1874,13 @@ class VisualDatabase:
 
         # Delete the group (CASCADE will remove all memberships)
         cursor.execute("DELETE FROM object_groups WHERE group_id = ?", (group_id,))
-        self.conn.commit()
+        self._commit()
+
+        if group_id == self._unclassified_group_id:
+            self._unclassified_group_id = None
         return cursor.rowcount > 0
 
+    @_write
     def update_group(self, group_id: int, group_name: Optional[str] = None,
                     description: Optional[str] = None) -> bool:
         """
@@ -1627,27 +1895,29 @@ class VisualDatabase:
             True if successful
         """
         cursor = self.conn.cursor()
-        updates = []
+        fields = []
         values = []
 
         if group_name is not None:
-            updates.append("group_name = ?")
+            fields.append("group_name")
             values.append(group_name)
 
         if description is not None:
-            updates.append("description = ?")
+            fields.append("description")
             values.append(description)
 
-        if not updates:
+        if not fields:
             return False
 
-        updates.append("updated_at = ?")
         values.append(datetime.now().isoformat())
         values.append(group_id)
 
-        query = f"UPDATE object_groups SET {', '.join(updates)} WHERE group_id = ?"
-        cursor.execute(query, values)
-        self.conn.commit()
+        cursor.execute(_build_update_sql('object_groups', tuple(fields), 'group_id'), values)
+        self._commit()
+
+        # A renamed Unclassified table no longer resolves by name
+        if group_name is not None and group_id == self._unclassified_group_id:
+            self._unclassified_group_id = None
         return cursor.rowcount > 0
 
     def close(self):
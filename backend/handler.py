@@ -9,134 +9,309 @@ Usage:
 4. Run: python handler_grounding_dino.py
 """
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 import uvicorn
 import base64
 import cv2
 import numpy as np
-from PIL import Image
-from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection
-from typing import Dict
+from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection, BatchFeature
 import torch
 import io
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from functools import lru_cache
 
-app = FastAPI(title="Grounding DINO Detector")
+MODEL_NAME = os.environ.get("GDINO_MODEL", "IDEA-Research/grounding-dino-tiny")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Load the model before the server accepts requests"""
+    if model is None:
+        load_model(MODEL_NAME)
+    yield
+
+
+app = FastAPI(title="Grounding DINO Detector", lifespan=lifespan)
 
 # Global model instance
 model = None
 processor = None
 device = None
+autocast_dtype = None
 current_classes = []
 
+# Serializes the forward pass between the batch worker and the compile warm-up
+model_lock = threading.Lock()
+
+# Micro-batching: requests arriving within MAX_BATCH_WAIT seconds share one forward pass
+MAX_BATCH = 4
+MAX_BATCH_WAIT = 0.005
+batch_queue = queue.Queue()
+batch_thread = None
+
+# Host-to-device staging (batch worker only): pinned buffers reused per (key, shape, dtype)
+# and a side stream for the copies, so uploads neither re-pin memory nor block the CPU
+MAX_PINNED_BUFFERS = 64
+pinned_buffers = {}
+copy_stream = None
+copy_done = None
 
-def load_model(model_name="IDEA-Research/grounding-dino-tiny"):
+# Opt-in torch.compile of the forward pass (GDINO_COMPILE=1); first requests pay the compile cost
+COMPILE_MODEL = os.environ.get("GDINO_COMPILE", "0") == "1"
+
+
+def load_model(model_name=MODEL_NAME):
     """Load Grounding DINO model"""
-    global model, processor, device
+    global model, processor, device, autocast_dtype, batch_thread
     print(f"Loading Grounding DINO model: {model_name}...")
 
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
     print(f"Using device: {device}")
 
+    if device == 'cuda':
+        # Tensor-core matmuls: TF32 for any FP32 ops, BF16 (or FP16) autocast for the rest
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+        torch.backends.cudnn.benchmark = True
+        autocast_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        print(f"Autocast dtype: {autocast_dtype}")
+
     processor = AutoProcessor.from_pretrained(model_name)
-    model = AutoModelForZeroShotObjectDetection.from_pretrained(model_name).to(device)
+    tokenize_prompt.cache_clear()
+    model = AutoModelForZeroShotObjectDetection.from_pretrained(model_name).to(device).eval()
+
+    if COMPILE_MODEL and device == 'cuda':
+        # Client frames have a fixed size, so specialize on static shapes and capture CUDA graphs
+        model = torch.compile(model, mode="reduce-overhead", fullgraph=False, dynamic=False)
+        print("Compiling model (warm-up pass)...")
+        warmup = np.zeros((1080, 1920, 3), dtype=np.uint8)
+        run_model(prepare_inputs(warmup, "object.").to(device))
+
+    if batch_thread is None:
+        batch_thread = threading.Thread(target=batch_worker, daemon=True)
+        batch_thread.start()
 
     print("✓ Model loaded")
     return model
 
 
-@app.post("/run")
-async def detect(request: Dict):
-    """
-    Grounding DINO detection endpoint
-    Compatible with RunPod serverless format
-    """
-    global model, processor, device, current_classes
+@lru_cache(maxsize=32)
+def tokenize_prompt(text):
+    """Tokenize a class prompt once; the client sends the same class list every frame"""
+    return processor.tokenizer(text, return_tensors="pt")
 
-    try:
-        # Load model on first request
-        if model is None:
-            model_name = request.get("input", {}).get("model", "IDEA-Research/grounding-dino-tiny")
-            load_model(model_name)
-
-        # Parse input
-        input_data = request.get("input", {})
-        image_b64 = input_data.get("image")
-        classes = input_data.get("classes", [])
-        confidence = input_data.get("confidence", 0.15)
-
-        if not image_b64 or not classes:
-            return {"error": "Missing image or classes"}
 
-        # Decode image
-        img_bytes = base64.b64decode(image_b64)
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(img_rgb)
+def prepare_inputs(img_rgb, text):
+    """Build model inputs from an RGB array and prompt without a PIL round-trip"""
+    image_inputs = processor.image_processor(img_rgb, return_tensors="pt")
+    return BatchFeature(data={**tokenize_prompt(text), **image_inputs})
+
+
+def run_model(inputs):
+    """Run the forward pass (mixed precision on GPU) and return FP32 logits/boxes"""
+    with model_lock, torch.inference_mode(), torch.autocast(device_type=device, dtype=autocast_dtype,
+                                                            enabled=autocast_dtype is not None):
+        outputs = model(**inputs)
+
+    # Post-process in FP32 so box coordinates keep full precision
+    outputs.logits = outputs.logits.float()
+    outputs.pred_boxes = outputs.pred_boxes.float()
+    return outputs
 
-        # Create text prompt from classes
-        text = ". ".join(classes) + "."
 
-        # Process inputs
-        inputs = processor(images=pil_image, text=text, return_tensors="pt").to(device)
+def to_device(inputs):
+    """Move inputs to the GPU through reused pinned buffers on the copy stream"""
+    global copy_stream, copy_done
+    if device != 'cuda':
+        return inputs.to(device)
 
-        # Run inference
-        with torch.no_grad():
-            outputs = model(**inputs)
+    if copy_stream is None:
+        copy_stream = torch.cuda.Stream()
+        copy_done = torch.cuda.Event()
+
+    # The previous upload must finish reading the staging buffers before they are refilled
+    copy_done.synchronize()
+    if len(pinned_buffers) > MAX_PINNED_BUFFERS:
+        pinned_buffers.clear()
+
+    staged = {}
+    for key, value in inputs.items():
+        buffer_key = (key, tuple(value.shape), value.dtype)
+        pinned = pinned_buffers.get(buffer_key)
+        if pinned is None:
+            pinned = pinned_buffers[buffer_key] = torch.empty(value.shape, dtype=value.dtype,
+                                                              pin_memory=True)
+        pinned.copy_(value)
+        # Allocated on the compute stream, which is the one that uses them
+        staged[key] = (pinned, torch.empty(value.shape, dtype=value.dtype, device=device))
+
+    compute_stream = torch.cuda.current_stream()
+    copy_stream.wait_stream(compute_stream)
+    with torch.cuda.stream(copy_stream):
+        for pinned, gpu in staged.values():
+            gpu.copy_(pinned, non_blocking=True)
+        copy_done.record()
+    compute_stream.wait_event(copy_done)
+
+    return inputs.__class__({key: gpu for key, (pinned, gpu) in staged.items()})
+
+
+def run_batch(items):
+    """Run one forward pass over items sharing a prompt and image size; resolve their futures"""
+    try:
+        inputs = items[0][1]
+        if len(items) > 1:
+            inputs = inputs.__class__({key: torch.cat([item[1][key] for item in items])
+                                       for key in inputs.keys()})
+        inputs = to_device(inputs)
+
+        outputs = run_model(inputs)
 
         # Post-process results - simpler API without thresholds
         results = processor.post_process_grounded_object_detection(
             outputs,
             inputs.input_ids,
-            target_sizes=[pil_image.size[::-1]]  # (height, width)
+            target_sizes=[item[2] for item in items]  # (height, width)
         )
+        for item, result in zip(items, results):
+            item[3].set_result(result)
+    except Exception as e:
+        for item in items:
+            if not item[3].done():
+                item[3].set_exception(e)
+
+
+def batch_worker():
+    """Collect queued requests for up to MAX_BATCH_WAIT and run them in compatible batches"""
+    while True:
+        pending = [batch_queue.get()]
+        deadline = time.monotonic() + MAX_BATCH_WAIT
+        while len(pending) < MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(batch_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        # Only requests with the same prompt and frame size can be stacked without padding
+        groups = {}
+        for item in pending:
+            groups.setdefault(item[0], []).append(item)
+
+        for items in groups.values():
+            run_batch(items)
+
+
+def run_detection(img_bytes, classes, confidence):
+    """Decode one JPEG, run the model and return the detection response"""
+    # Decode image
+    nparr = np.frombuffer(img_bytes, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+    # Create text prompt from classes
+    text = ". ".join(classes) + "."
+
+    # Process inputs
+    inputs = prepare_inputs(img_rgb, text)
+
+    # Hand off to the batch worker and wait for this request's result
+    future = Future()
+    target_size = img_rgb.shape[:2]  # (height, width)
+    batch_queue.put(((text, target_size), inputs, target_size, future))
+    results = [future.result()]
+
+    detections = []
+
+    if len(results) > 0:
+        result = results[0]
+        boxes = result["boxes"].cpu().numpy()
+        scores = result["scores"].cpu().numpy()
+
+        # Use text_labels for v4.51.0+, fallback to labels for older versions
+        labels = result.get("text_labels", result.get("labels"))
+
+        for box, score, label in zip(boxes, scores, labels):
+            # Apply confidence threshold manually
+            if float(score) < confidence:
+                continue
+
+            # box is in [x_min, y_min, x_max, y_max] format
+            x1, y1, x2, y2 = box
+            x = int(x1)
+            y = int(y1)
+            w = int(x2 - x1)
+            h = int(y2 - y1)
+            cx = int((x1 + x2) / 2)
+            cy = int((y1 + y2) / 2)
+
+            # Find class_id from label text
+            class_name = label.lower()
+            class_id = -1
+            for i, cls in enumerate(classes):
+                if cls.lower() in class_name or class_name in cls.lower():
+                    class_id = i
+                    class_name = classes[i]
+                    break
+
+            if class_id == -1:
+                # Use the detected label as-is if no exact match
+                class_id = len(classes)
+
+            detections.append({
+                "class_id": class_id,
+                "class_name": class_name,
+                "confidence": float(score),
+                "bbox": (x, y, w, h),
+                "center": (cx, cy)
+            })
+
+    return {"detections": detections, "num_detections": len(detections)}
 
-        detections = []
-
-        if len(results) > 0:
-            result = results[0]
-            boxes = result["boxes"].cpu().numpy()
-            scores = result["scores"].cpu().numpy()
-
-            # Use text_labels for v4.51.0+, fallback to labels for older versions
-            labels = result.get("text_labels", result.get("labels"))
-
-            for box, score, label in zip(boxes, scores, labels):
-                # Apply confidence threshold manually
-                if float(score) < confidence:
-                    continue
-
-                # box is in [x_min, y_min, x_max, y_max] format
-                x1, y1, x2, y2 = box
-                x = int(x1)
-                y = int(y1)
-                w = int(x2 - x1)
-                h = int(y2 - y1)
-                cx = int((x1 + x2) / 2)
-                cy = int((y1 + y2) / 2)
-
-                # Find class_id from label text
-                class_name = label.lower()
-                class_id = -1
-                for i, cls in enumerate(classes):
-                    if cls.lower() in class_name or class_name in cls.lower():
-                        class_id = i
-                        class_name = classes[i]
-                        break
-
-                if class_id == -1:
-                    # Use the detected label as-is if no exact match
-                    class_id = len(classes)
-
-                detections.append({
-                    "class_id": class_id,
-                    "class_name": class_name,
-                    "confidence": float(score),
-                    "bbox": (x, y, w, h),
-                    "center": (cx, cy)
-                })
-
-        return {"detections": detections, "num_detections": len(detections)}
+
+@app.post("/run")
+async def detect(request: Request):
+    """
+    Grounding DINO detection endpoint
+
+    Accepts either:
+    - Raw JPEG body (Content-Type: image/jpeg or application/octet-stream) with
+      ?classes=a&classes=b&confidence=0.5 query parameters
+    - RunPod serverless JSON format: {"input": {"image": <base64>, "classes": [...], "confidence": ...}}
+    """
+    global model, processor, device, current_classes
+
+    try:
+        content_type = request.headers.get("content-type", "")
+
+        if content_type.startswith(("image/", "application/octet-stream")):
+            # Raw binary upload - no base64 decode needed
+            params = request.query_params
+            img_bytes = await request.body()
+            classes = params.getlist("classes")
+            confidence = float(params.get("confidence", 0.15))
+        else:
+            # Parse input
+            input_data = (await request.json()).get("input", {})
+            image_b64 = input_data.get("image")
+            img_bytes = base64.b64decode(image_b64) if image_b64 else b""
+            classes = input_data.get("classes", [])
+            confidence = input_data.get("confidence", 0.15)
+
+        if not img_bytes or not classes:
+            return {"error": "Missing image or classes"}
+
+        # Decode, preprocess and post-process off the event loop so the next upload
+        # is received and decoded while the GPU is still busy with this one
+        return await run_in_threadpool(run_detection, img_bytes, classes, confidence)
 
     except Exception as e:
         import traceback
@@ -159,8 +334,5 @@ if __name__ == "__main__":
     print("Endpoint: http://0.0.0.0:8000/run")
     print("=" * 70)
 
-    # Pre-load model
-    load_model()
-
-    # Run server
+    # Run server (the model is loaded by the lifespan hook before requests are accepted)
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -3,9 +3,53 @@
 import numpy as np
 import cv2
 import math
+import threading
+import time
+from functools import lru_cache
 from pykinect2 import PyKinectV2
 from pykinect2 import PyKinectRuntime
 
+# Class-specific typical depths for estimate_depth (can be tuned based on your setup)
+CLASS_TYPICAL_DEPTHS = {
+    'laptop': 1200,
+    'laptop computer': 1200,
+    'mouse': 1000,
+    'wireless mouse': 1000,
+    'keyboard': 1200,
+    'mechanical keyboard': 1200,
+    'phone': 1100,
+    'smartphone': 1100,
+    'water bottle': 1000,
+    'coffee mug': 1000,
+    'notebook': 1200,
+    'book': 1200,
+    'tablet': 1100,
+    'headphones': 1100,
+}
+
+GLOBAL_DEFAULT_DEPTH = 1200  # 1.2m - typical desk distance
+
+# Reference: typical laptop at ~1200mm is about 150x200px = 30000px²
+REFERENCE_AREA = 30000
+REFERENCE_DEPTH = 1200
+
+
+@lru_cache(maxsize=181)
+def _pan_rotation(pan_angle):
+    """(cos, sin) of the camera -> world rotation for a pan angle (90° = forward); cached per angle"""
+    theta = math.radians(pan_angle - 90)
+    return math.cos(theta), math.sin(theta)
+
+
+@lru_cache(maxsize=4)
+def _depth_color_lut(max_depth):
+    """Raw uint16 depth -> JET-colored BGR table (65536 x 3); depth 0 (no reading) maps to black"""
+    normalized = (np.clip(np.arange(65536), 0, max_depth) / max_depth * 255).astype(np.uint8)
+    lut = cv2.applyColorMap(normalized.reshape(-1, 1), cv2.COLORMAP_JET).reshape(-1, 3)
+    lut[0] = 0
+    lut.setflags(write=False)
+    return lut
+
 
 class KinectCamera:
 
@@ -27,24 +71,96 @@ class KinectCamera:
         self.cx = 257.588
         self.cy = 209.131
 
+        # Precomputed reciprocal focal lengths and color -> depth pixel scale factors
+        self._inv_fx = 1.0 / self.fx
+        self._inv_fy = 1.0 / self.fy
+        self._color_to_depth_x = self.depth_width / self.color_width
+        self._color_to_depth_y = self.depth_height / self.color_height
+        self._depth_x_max = self.depth_width - 1
+        self._depth_y_max = self.depth_height - 1
+
+        # Per-pixel normalized ray directions for full-frame unprojection (xyz = ray * depth)
+        ys, xs = np.mgrid[0:self.depth_height, 0:self.depth_width].astype(np.float32)
+        self._x_rays = (xs - np.float32(self.cx)) * np.float32(self._inv_fx)
+        self._y_rays = (ys - np.float32(self.cy)) * np.float32(self._inv_fy)
+        self._pan_rays = None  # (pan_angle, x_rays, z_rays) rotated for the last pan angle used
+
+        # Triple-buffered color frames (avoids a fresh ~6MB array per frame):
+        # the capture thread fills _color_back, publishes it as _color_ready, and
+        # get_frames swaps the ready buffer out to the caller as _color_front
+        self._color_back, self._color_ready, self._color_front = [
+            np.empty((self.color_height, self.color_width, 3), np.uint8) for _ in range(3)]
+        self._color_new = False
+        self._color_raw = None  # Only allocated if pykinect2 ever hands back a non-contiguous buffer
+        self._depth_ready = None
+        self._frame_lock = threading.Lock()
+        self.frame_event = threading.Event()  # Set whenever a new color or depth frame is published
+
+        # Acquire frames on a background thread so USB transfer and color conversion
+        # overlap with detection and drawing in the main loop
+        self._running = True
+        self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._capture_thread.start()
+
         print(f"[OK] Kinect initialized")
         print(f"  Color: {self.color_width}x{self.color_height}")
         print(f"  Depth: {self.depth_width}x{self.depth_height}")
 
-    def get_frames(self):
-        rgb_frame = None
-        depth_frame = None
+    def _capture_loop(self):
+        """Capture thread: pull new frames from the runtime and publish the latest ones"""
+        while self._running:
+            published = False
+
+            if self.kinect.has_new_color_frame():
+                frame = self.kinect.get_last_color_frame()
+                if not frame.flags['C_CONTIGUOUS']:
+                    # reshape would silently allocate a copy every frame; make it explicit and reuse the buffer
+                    if self._color_raw is None:
+                        self._color_raw = np.empty(frame.shape, dtype=frame.dtype)
+                    np.copyto(self._color_raw, frame)
+                    frame = self._color_raw
+                frame = frame.reshape((self.color_height, self.color_width, 4))
+                cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR, dst=self._color_back)
+                with self._frame_lock:
+                    self._color_back, self._color_ready = self._color_ready, self._color_back
+                    self._color_new = True
+                published = True
+
+            if self.kinect.has_new_depth_frame():
+                # pykinect2 already hands back a private uint16 copy; reshape is a zero-copy view
+                # as long as that copy is C-contiguous (ascontiguousarray is a no-op then)
+                frame = np.ascontiguousarray(self.kinect.get_last_depth_frame())
+                depth_frame = frame.reshape((self.depth_height, self.depth_width))
+                with self._frame_lock:
+                    self._depth_ready = depth_frame
+                published = True
+
+            if published:
+                self.frame_event.set()
+            else:
+                time.sleep(0.001)
 
-        if self.kinect.has_new_color_frame():
-            frame = self.kinect.get_last_color_frame()
-            frame = frame.reshape((self.color_height, self.color_width, 4))
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2RGB)
+    def get_frames(self):
+        """
+        Returns (bgr_frame, depth_frame); either is None if no new frame arrived
+        since the last call. Never blocks; use frame_event to wait for new frames.
+        The color frame is BGR (OpenCV's native order), so display and JPEG encoding need no conversion.
+        Color frames live in reused buffers: each stays valid until the next
+        get_frames call, so copy it to keep it longer. Depth frames are fresh
+        uint16 arrays owned by the caller.
+        """
+        bgr_frame = None
 
-        if self.kinect.has_new_depth_frame():
-            frame = self.kinect.get_last_depth_frame()
-            depth_frame = frame.reshape((self.depth_height, self.depth_width)).astype(np.uint16)
+        with self._frame_lock:
+            self.frame_event.clear()
+            if self._color_new:
+                self._color_front, self._color_ready = self._color_ready, self._color_front
+                self._color_new = False
+                bgr_frame = self._color_front
+            depth_frame = self._depth_ready
+            self._depth_ready = None
 
-        return rgb_frame, depth_frame
+        return bgr_frame, depth_frame
 
     def pixel_to_3d(self, pixel_x, pixel_y, depth_mm, pan_angle=None):
         """
@@ -62,20 +178,75 @@ class KinectCamera:
                        If pan_angle=None: camera-relative coords
                        If pan_angle provided: world coords with 90° = forward (+Z)
         """
-        if depth_mm == 0:
-            return (0, 0, 0)
+        return tuple(self.pixels_to_3d(pixel_x, pixel_y, depth_mm, pan_angle=pan_angle).tolist())
+
+    def pixels_to_3d(self, pixel_x, pixel_y, depth_mm, pan_angle=None):
+        """
+        Vectorized pixel_to_3d: project arrays of depth-frame pixels in one pass
+
+        Args:
+            pixel_x, pixel_y: Pixel coordinates in depth frame (scalars or arrays, any shape)
+            depth_mm: Depth values in millimeters, same shape (0 = no depth)
+            pan_angle: Optional pan servo angle, as in pixel_to_3d
+
+        Returns:
+            float64 array of shape (..., 3) in mm; points with zero depth are (0, 0, 0)
+        """
+        depth_mm = np.asarray(depth_mm)
+        z_cam = depth_mm.astype(np.float64)
+        x_cam = (np.asarray(pixel_x, dtype=np.float64) - self.cx) * z_cam * self._inv_fx
+        y_cam = (np.asarray(pixel_y, dtype=np.float64) - self.cy) * z_cam * self._inv_fy
 
-        # Camera-relative coordinates (standard pinhole projection)
-        z_cam = float(depth_mm)
-        x_cam = (pixel_x - self.cx) * z_cam / self.fx
-        y_cam = (pixel_y - self.cy) * z_cam / self.fy
+        if pan_angle is not None:
+            # Same XZ-plane rotation as camera_to_world_coords, applied to every point at once
+            c, s = _pan_rotation(pan_angle)
+            x_cam, z_cam = c * x_cam - s * z_cam, s * x_cam + c * z_cam
+
+        points = np.stack([x_cam, y_cam, z_cam], axis=-1)
+        points[depth_mm == 0] = 0
+        return points
+
+    def unproject_frame(self, depth_frame, pan_angle=None, out=None):
+        """
+        Unproject a whole depth frame to 3D points
+
+        Args:
+            depth_frame: Depth frame (H, W) in mm
+            pan_angle: Optional pan servo angle; if provided, returns world coordinates
+            out: Optional preallocated float32 (H, W, 3) array to write into and return
+
+        Returns:
+            float32 array of shape (H, W, 3) in mm; pixels with zero depth are (0, 0, 0)
+        """
+        if out is None:
+            out = np.empty(depth_frame.shape + (3,), dtype=np.float32)
 
-        # If no pan angle, return camera-relative coords
         if pan_angle is None:
-            return (x_cam, y_cam, z_cam)
+            x_rays, z_rays = self._x_rays, None
+        else:
+            x_rays, z_rays = self._rotated_rays(pan_angle)
 
-        # Transform to world coordinates based on pan angle
-        return self.camera_to_world_coords(x_cam, y_cam, z_cam, pan_angle)
+        # Mixed uint16 * float32 multiplies straight into the output planes, no temporaries
+        np.multiply(x_rays, depth_frame, out=out[..., 0])
+        np.multiply(self._y_rays, depth_frame, out=out[..., 1])
+        if z_rays is None:
+            out[..., 2] = depth_frame
+        else:
+            np.multiply(z_rays, depth_frame, out=out[..., 2])
+        return out
+
+    def _rotated_rays(self, pan_angle):
+        """
+        X and Z ray planes rotated to world coordinates for a pan angle.
+        Rotating the rays (z ray = 1) instead of the cloud keeps unproject_frame
+        at three multiplies; the planes are kept for the last angle, which the
+        live loop repeats until the servo moves.
+        """
+        if self._pan_rays is None or self._pan_rays[0] != pan_angle:
+            # Same XZ-plane rotation as camera_to_world_coords, Y unchanged
+            c, s = (np.float32(v) for v in _pan_rotation(pan_angle))
+            self._pan_rays = (pan_angle, c * self._x_rays - s, s * self._x_rays + c)
+        return self._pan_rays[1], self._pan_rays[2]
 
     def estimate_depth(self, bbox, class_name=None, last_known_depth=None):
         """
@@ -90,26 +261,6 @@ class KinectCamera:
         Returns:
             Estimated depth in millimeters
         """
-        # Class-specific typical depths (can be tuned based on your setup)
-        CLASS_TYPICAL_DEPTHS = {
-            'laptop': 1200,
-            'laptop computer': 1200,
-            'mouse': 1000,
-            'wireless mouse': 1000,
-            'keyboard': 1200,
-            'mechanical keyboard': 1200,
-            'phone': 1100,
-            'smartphone': 1100,
-            'water bottle': 1000,
-            'coffee mug': 1000,
-            'notebook': 1200,
-            'book': 1200,
-            'tablet': 1100,
-            'headphones': 1100,
-        }
-        
-        GLOBAL_DEFAULT_DEPTH = 1200  # 1.2m - typical desk distance
-        
         # Priority 1: Use last known real depth if available and reasonable
         if last_known_depth and 500 <= last_known_depth <= 3000:
             return last_known_depth
@@ -117,22 +268,17 @@ class KinectCamera:
         # Priority 2: Bbox size-based estimation
         x, y, w, h = bbox
         bbox_area = w * h
-        
-        # Reference: typical laptop at ~1200mm is about 150x200px = 30000px²
-        reference_area = 30000
-        reference_depth = 1200
-        
+
         # Inverse square relationship (larger bbox = closer)
         if bbox_area > 0:
-            estimated_depth = reference_depth * math.sqrt(reference_area / bbox_area)
+            estimated_depth = REFERENCE_DEPTH * math.sqrt(REFERENCE_AREA / bbox_area)
         else:
             estimated_depth = GLOBAL_DEFAULT_DEPTH
         
         # Priority 3: Blend with class-specific default if available
         if class_name:
-            class_name_lower = class_name.lower()
-            if class_name_lower in CLASS_TYPICAL_DEPTHS:
-                class_depth = CLASS_TYPICAL_DEPTHS[class_name_lower]
+            class_depth = CLASS_TYPICAL_DEPTHS.get(class_name.lower())
+            if class_depth is not None:
                 # 70% bbox-based, 30% class default
                 estimated_depth = 0.7 * estimated_depth + 0.3 * class_depth
         
@@ -141,6 +287,44 @@ class KinectCamera:
         
         return estimated_depth
 
+    def estimate_depth_batch(self, bboxes, class_names=None, last_known_depths=None):
+        """
+        Vectorized estimate_depth for all detections missing depth in a frame
+
+        Args:
+            bboxes: Array-like of bounding boxes, shape (N, 4) as (x, y, w, h)
+            class_names: Optional sequence of N class names (None entries allowed)
+            last_known_depths: Optional array of N last measured depths (0/NaN = unknown)
+
+        Returns:
+            (N,) float64 array of estimated depths in millimeters
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        areas = bboxes[:, 2] * bboxes[:, 3]
+
+        # Inverse square relationship (larger bbox = closer); global default for empty boxes
+        estimated = np.full(len(bboxes), float(GLOBAL_DEFAULT_DEPTH))
+        has_area = areas > 0
+        estimated[has_area] = REFERENCE_DEPTH * np.sqrt(REFERENCE_AREA / areas[has_area])
+
+        # Blend with class-specific defaults: 70% bbox-based, 30% class default
+        if class_names is not None:
+            class_depths = np.array([CLASS_TYPICAL_DEPTHS.get(name.lower(), np.nan) if name else np.nan
+                                     for name in class_names], dtype=np.float64)
+            has_class = ~np.isnan(class_depths)
+            estimated[has_class] = 0.7 * estimated[has_class] + 0.3 * class_depths[has_class]
+
+        # Clamp to reasonable range (0.5m to 3m)
+        np.clip(estimated, 500, 3000, out=estimated)
+
+        # Last known real depth wins when available and reasonable
+        if last_known_depths is not None:
+            last_known = np.asarray(last_known_depths, dtype=np.float64)
+            valid = (last_known >= 500) & (last_known <= 3000)
+            estimated[valid] = last_known[valid]
+
+        return estimated
+
     def camera_to_world_coords(self, x_cam, y_cam, z_cam, pan_angle):
         """
         Transform camera-relative coordinates to world coordinates
@@ -158,39 +342,44 @@ class KinectCamera:
         Returns:
             (x_world, y_world, z_world): World coordinates in mm
         """
-        # Calculate rotation angle from reference (90° = 0 offset)
-        theta = math.radians(pan_angle - 90)
+        # Rotation from reference (90° = 0 offset); sin/cos cached per pan angle
+        cos_t, sin_t = _pan_rotation(pan_angle)
 
         # Rotate in XZ plane (horizontal), Y unchanged (vertical)
-        x_world = x_cam * math.cos(theta) - z_cam * math.sin(theta)
+        x_world = x_cam * cos_t - z_cam * sin_t
         y_world = y_cam  # Vertical axis stays the same
-        z_world = x_cam * math.sin(theta) + z_cam * math.cos(theta)
+        z_world = x_cam * sin_t + z_cam * cos_t
 
         return (x_world, y_world, z_world)
 
     def map_color_to_depth(self, color_x, color_y):
-        depth_x = int(color_x * self.depth_width / self.color_width)
-        depth_y = int(color_y * self.depth_height / self.color_height)
+        depth_x = int(color_x * self._color_to_depth_x)
+        depth_y = int(color_y * self._color_to_depth_y)
 
-        depth_x = max(0, min(depth_x, self.depth_width - 1))
-        depth_y = max(0, min(depth_y, self.depth_height - 1))
+        # Inline clamps (avoids builtin min/max call overhead on this per-detection path)
+        depth_x = 0 if depth_x < 0 else (self._depth_x_max if depth_x > self._depth_x_max else depth_x)
+        depth_y = 0 if depth_y < 0 else (self._depth_y_max if depth_y > self._depth_y_max else depth_y)
 
         return (depth_x, depth_y)
 
+    def map_color_to_depth_batch(self, color_xs, color_ys):
+        """Vectorized map_color_to_depth; returns (depth_xs, depth_ys) int arrays"""
+        depth_xs = (np.asarray(color_xs) * self._color_to_depth_x).astype(np.int32)
+        depth_ys = (np.asarray(color_ys) * self._color_to_depth_y).astype(np.int32)
+        np.clip(depth_xs, 0, self._depth_x_max, out=depth_xs)
+        np.clip(depth_ys, 0, self._depth_y_max, out=depth_ys)
+        return depth_xs, depth_ys
+
     def visualize_depth(self, depth_frame, max_depth=4500):
         if depth_frame is None:
             return None
 
-        depth_normalized = np.clip(depth_frame, 0, max_depth)
-        depth_normalized = (depth_normalized / max_depth * 255).astype(np.uint8)
-
-        depth_colored = cv2.applyColorMap(depth_normalized, cv2.COLORMAP_JET)
-
-        depth_colored[depth_frame == 0] = [0, 0, 0]
-
-        return depth_colored
+        # Normalize, colormap and zero-masking fused into one table lookup per pixel
+        return np.take(_depth_color_lut(max_depth), depth_frame, axis=0)
 
     def close(self):
+        self._running = False
+        self._capture_thread.join(timeout=1.0)
         if self.kinect:
             self.kinect.close()
         print("Kinect closed")
@@ -210,29 +399,34 @@ if __name__ == "__main__":
     cv2.namedWindow('Kinect RGB', cv2.WINDOW_NORMAL)
     cv2.namedWindow('Kinect Depth', cv2.WINDOW_NORMAL)
 
+    # Reused preview buffer (exact 2x shrink, so INTER_AREA costs the same as bilinear)
+    preview_buf = np.empty((540, 960, 3), dtype=np.uint8)
+
+    depth_vis = None
+
     try:
         while True:
-            rgb, depth = kinect.get_frames()
+            bgr, depth = kinect.get_frames()
 
-            if rgb is not None:
-                rgb_bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
-                rgb_display = cv2.resize(rgb_bgr, (960, 540))
-                cv2.imshow('Kinect RGB', rgb_display)
+            if bgr is not None:
+                cv2.resize(bgr, (960, 540), dst=preview_buf, interpolation=cv2.INTER_AREA)
+                cv2.imshow('Kinect RGB', preview_buf)
 
             if depth is not None:
+                # Depth is already 512x424, show it without a resize copy
                 depth_vis = kinect.visualize_depth(depth)
-                depth_display = cv2.resize(depth_vis, (512, 424))
-                cv2.imshow('Kinect Depth', depth_display)
+                cv2.imshow('Kinect Depth', depth_vis)
 
             key = cv2.waitKey(1) & 0xFF
             if key == ord('q'):
                 break
             elif key == ord('s'):
-                if rgb is not None:
-                    cv2.imwrite('test_rgb.png', cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+                if bgr is not None:
+                    cv2.imwrite('test_rgb.png', bgr)
                     print("Saved test_rgb.png")
-                if depth is not None:
-                    cv2.imwrite('test_depth.png', kinect.visualize_depth(depth))
+                if depth_vis is not None:
+                    # Save the visualization already shown instead of recoloring the frame
+                    cv2.imwrite('test_depth.png', depth_vis)
                     print("Saved test_depth.png")
 
     except KeyboardInterrupt:
@@ -31,6 +31,8 @@ Requirements:
 import serial
 import time
 import sys
+import math
+import numpy as np
 import serial.tools.list_ports
 
 
@@ -50,6 +52,10 @@ class KinectPanTilt:
         self.baudrate = baudrate
         self.ser = None
 
+        # Last commanded angles (the firmware centers the servos on startup)
+        self.pan_angle = 90
+        self.tilt_angle = 110
+
         # Find port if not specified
         if port is None:
             port = self._find_arduino_port()
@@ -84,42 +90,73 @@ class KinectPanTilt:
             raise RuntimeError("Serial connection not open")
 
         self.ser.write(f"{command}\n".encode())
-        time.sleep(0.1)
 
     def _read_responses(self, timeout=0.5):
-        """Read and print responses from Arduino"""
-        start_time = time.time()
+        """
+        Read and print responses from Arduino
+        Returns as soon as a reply line arrives and nothing more is buffered;
+        waits at most `timeout` seconds for the first line.
+        """
+        if self.ser.timeout != timeout:
+            self.ser.timeout = timeout
         responses = []
 
-        while time.time() - start_time < timeout:
-            if self.ser.in_waiting:
-                try:
-                    response = self.ser.readline().decode('utf-8').strip()
-                    if response:
-                        print(f"[Pan-Tilt] {response}")
-                        responses.append(response)
-                except UnicodeDecodeError:
-                    pass
-            time.sleep(0.05)
+        while True:
+            line = self.ser.readline()  # Returns on newline or timeout
+            if not line:
+                break
+            response = line.decode('utf-8', 'ignore').strip()
+            if response:
+                print(f"[Pan-Tilt] {response}")
+                responses.append(response)
+            if not self.ser.in_waiting:
+                break
 
         return responses
 
-    def calibrate(self):
+    def _settle(self, timeout=0.05):
+        """
+        Short pause after a velocity or stop command. Drains its reply, if any,
+        so the next move's _read_responses does not pick it up, and paces
+        repeated commands (key repeat) to the firmware's loop.
+        """
+        self._read_responses(timeout=timeout)
+
+    def _wait_for(self, sentinel, timeout):
+        """Print Arduino output until a line equal to `sentinel` arrives; False on timeout"""
+        if self.ser.timeout != 0.5:
+            self.ser.timeout = 0.5
+        deadline = time.time() + timeout
+
+        while time.time() < deadline:
+            line = self.ser.readline()
+            if not line:
+                continue
+            response = line.decode('utf-8', 'ignore').strip()
+            if response:
+                print(f"[Pan-Tilt] {response}")
+            if response == sentinel:
+                return True
+
+        return False
+
+    def calibrate(self, timeout=20):
         """
         Run calibration routine
         Moves pan servo: 90° -> 0° -> 180° -> 90°
+        Returns as soon as the Arduino reports CAL_DONE (~13s), or after `timeout` seconds
         """
         print("Running pan-tilt calibration...")
         self._send_command('cal')
-        # Calibration takes ~13 seconds (90->0: 2.7s, 0->180: 5.4s, 180->90: 2.7s + delays)
-        time.sleep(14)
-        self._read_responses()
-        print("Calibration complete")
+        if self._wait_for('CAL_DONE', timeout):
+            print("Calibration complete")
+        else:
+            print(f"Calibration did not report completion within {timeout}s")
 
     def center(self):
         """Move both servos to center position (Pan: 90°, Tilt: 110°)"""
         self._send_command('c')
-        time.sleep(0.2)
+        self.pan_angle, self.tilt_angle = 90, 110
         self._read_responses()
 
     def move_pan(self, angle):
@@ -134,8 +171,7 @@ class KinectPanTilt:
             raise ValueError("Pan angle must be between 0 and 180")
 
         self._send_command(f'p:{int(angle)}')
-        # Calculate approximate movement time (30ms per degree)
-        time.sleep(0.1)
+        self.pan_angle = int(angle)
         self._read_responses(timeout=0.2)
 
     def move_tilt(self, angle):
@@ -150,7 +186,7 @@ class KinectPanTilt:
             raise ValueError("Tilt angle must be between 90 and 180")
 
         self._send_command(f't:{int(angle)}')
-        time.sleep(0.1)
+        self.tilt_angle = int(angle)
         self._read_responses(timeout=0.2)
 
     def move_both(self, pan_angle, tilt_angle):
@@ -167,7 +203,7 @@ class KinectPanTilt:
             raise ValueError("Tilt angle must be between 90 and 180")
 
         self._send_command(f'b:{int(pan_angle)},{int(tilt_angle)}')
-        time.sleep(0.1)
+        self.pan_angle, self.tilt_angle = int(pan_angle), int(tilt_angle)
         self._read_responses(timeout=0.2)
 
     def set_pan_velocity(self, velocity):
@@ -180,6 +216,7 @@ class KinectPanTilt:
                       0 = stop
         """
         self._send_command(f'vp:{velocity}')
+        self._settle()
 
     def set_tilt_velocity(self, velocity):
         """
@@ -191,40 +228,73 @@ class KinectPanTilt:
                       0 = stop
         """
         self._send_command(f'vt:{velocity}')
+        self._settle()
 
     def stop_all(self):
         """Stop all servo movement"""
         self._send_command('stop')
+        self._settle()
 
     def stop_pan(self):
         """Stop pan servo movement only"""
         self._send_command('sp')
+        self._settle()
 
     def stop_tilt(self):
         """Stop tilt servo movement only"""
         self._send_command('st')
+        self._settle()
 
     def point_at_object(self, x, y, z):
         """
-        Point camera at object at 3D coordinates (future implementation)
+        Point camera at object at 3D coordinates
 
-        This will calculate the required pan/tilt angles to point the camera
-        at an object detected at position (x, y, z) in millimeters.
+        Closed-form pan/tilt solution for a point in world coordinates as
+        returned by KinectCamera.pixel_to_3d(..., pan_angle=...): 90° pan faces
+        +Z, 180° faces +X, and Y grows downward as in the depth image.
 
         Args:
             x: X coordinate in mm (horizontal)
-            y: Y coordinate in mm (vertical)
+            y: Y coordinate in mm (vertical, positive = down)
             z: Z coordinate in mm (depth)
 
-        Note: This requires camera mount geometry calibration
+        Returns:
+            (pan_angle, tilt_angle) that were sent, clamped to the servo ranges
+
+        Note: Assumes the camera sits on the pan/tilt axes; mount offsets are not modelled
+        """
+        pan = 90.0 + math.degrees(math.atan2(x, z))
+        tilt = 110.0 - math.degrees(math.atan2(y, math.hypot(x, z)))
+
+        pan = max(0.0, min(180.0, pan))
+        tilt = max(90.0, min(180.0, tilt))
+
+        self.move_both(pan, tilt)
+        return (int(pan), int(tilt))
+
+    def point_at_objects(self, points):
         """
-        # TODO: Implement coordinate-to-angle conversion
-        # This will depend on:
-        # - Camera height and position relative to servo mount
-        # - Servo orientation and mounting angles
-        # - Kinematic model of the pan-tilt mechanism
+        Point camera at whichever of several 3D targets needs the smallest move
+
+        Args:
+            points: Array-like of shape (N, 3) with world (x, y, z) in mm,
+                    same convention as point_at_object
 
-        raise NotImplementedError("Object pointing requires mount geometry calibration")
+        Returns:
+            (index, pan_angle, tilt_angle) of the chosen target, or None if points is empty
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if len(points) == 0:
+            return None
+
+        x, y, z = points[:, 0], points[:, 1], points[:, 2]
+        pans = np.clip(90.0 + np.degrees(np.arctan2(x, z)), 0.0, 180.0)
+        tilts = np.clip(110.0 - np.degrees(np.arctan2(y, np.hypot(x, z))), 90.0, 180.0)
+
+        # Pick the target closest to where the camera already points: one serial command
+        best = int(np.argmin(np.abs(pans - self.pan_angle) + np.abs(tilts - self.tilt_angle)))
+        self.move_both(pans[best], tilts[best])
+        return (best, int(pans[best]), int(tilts[best]))
 
     def close(self):
         """Close serial connection"""
@@ -42,7 +42,14 @@ class BehavioralState(str, Enum):
     PRODUCT_PURCHASED = "PRODUCT_PURCHASED" # Moved then exited (taken)
 
 
-@dataclass
+# Main events after which an object can no longer time out (built once: the inline
+# tuple re-resolved three enum attributes on every check)
+_TERMINAL_STATES = frozenset({BehavioralState.WINDOW_SHOPPED,
+                              BehavioralState.CART_ABANDONED,
+                              BehavioralState.PRODUCT_PURCHASED})
+
+
+@dataclass(slots=True)
 class ObjectMovementState:
     """Tracks movement state for a single object"""
     object_id: int
@@ -57,7 +64,7 @@ class ObjectMovementState:
     current_x: float = 0.0
     current_y: float = 0.0
 
-    # Smoothed position (EMA filtered to reduce bbox jitter)
+    # Smoothed position (EMA filtered to reduce bbox jitter; seeded with home at registration)
     smoothed_x: float = 0.0
     smoothed_y: float = 0.0
 
@@ -79,6 +86,14 @@ class ObjectMovementState:
     frame_height: int = 1080
 
 
+@dataclass(slots=True)
+class PersonProximityState:
+    """Tracks person presence around a single object (for WINDOW_SHOPPED)"""
+    person_triggered: bool = False
+    person_first_seen: Optional[float] = None   # When the person entered the frame
+    trigger_count: int = 0
+
+
 class MovementDetector:
     """
     CV-based movement detector using 2D bounding box center coordinates.
@@ -118,15 +133,21 @@ class MovementDetector:
         self.stabilization_time = stabilization_time
         self.cart_abandoned_cooldown = cart_abandoned_cooldown
 
+        # Threshold pixels, cached for the per-frame checks (see _recompute_thresholds)
+        self._recompute_thresholds()
+
         # Object states: {(view_angle, class_name): ObjectMovementState}
         self.object_states: Dict[Tuple[int, str], ObjectMovementState] = {}
 
+        # Keys of objects with is_moved=True, in the order they moved (dict used as an
+        # ordered set), so the timeout scan only visits objects that can time out
+        self._moved_keys: Dict[Tuple[int, str], None] = {}
+
         # Pending behavioral events (to be consumed by event system)
         self.pending_events: List[Dict] = []
 
         # Person presence tracking for WINDOW_SHOPPED
-        # {(view_angle, class_name): {'person_triggered': bool, 'person_first_seen': float, 'trigger_count': int}}
-        self.person_proximity: Dict[Tuple[int, str], Dict] = {}
+        self.person_proximity: Dict[Tuple[int, str], PersonProximityState] = {}
 
         print(f"[MovementDetector] Initialized with {movement_threshold_percent}% threshold")
         print(f"[MovementDetector] Stabilization time: {stabilization_time}s (no movement detection during this period)")
@@ -135,13 +156,21 @@ class MovementDetector:
         print(f"[MovementDetector] Frame dimensions: {frame_width}x{frame_height}")
         print(f"[MovementDetector] Threshold pixels: X={self._get_threshold_x():.0f}px, Y={self._get_threshold_y():.0f}px")
 
+    def _recompute_thresholds(self):
+        """Cache threshold pixels; call whenever the threshold or frame dimensions change"""
+        self._threshold_x = self.frame_width * (self.movement_threshold_percent / 100.0)
+        self._threshold_y = self.frame_height * (self.movement_threshold_percent / 100.0)
+        # Return-to-home hysteresis uses half the threshold (see _is_within_threshold)
+        self._threshold_x_half = self._threshold_x * 0.5
+        self._threshold_y_half = self._threshold_y * 0.5
+
     def _get_threshold_x(self) -> float:
         """Get X-axis threshold in pixels"""
-        return self.frame_width * (self.movement_threshold_percent / 100.0)
+        return self._threshold_x
 
     def _get_threshold_y(self) -> float:
         """Get Y-axis threshold in pixels"""
-        return self.frame_height * (self.movement_threshold_percent / 100.0)
+        return self._threshold_y
 
     def set_threshold(self, percent: float):
         """
@@ -151,6 +180,7 @@ class MovementDetector:
             percent: New threshold percentage (0-100)
         """
         self.movement_threshold_percent = max(0.0, min(100.0, percent))
+        self._recompute_thresholds()
         print(f"[MovementDetector] Threshold updated to {self.movement_threshold_percent}%")
         print(f"[MovementDetector] New threshold pixels: X={self._get_threshold_x():.0f}px, Y={self._get_threshold_y():.0f}px")
 
@@ -158,6 +188,7 @@ class MovementDetector:
         """Update frame dimensions for threshold calculation"""
         self.frame_width = width
         self.frame_height = height
+        self._recompute_thresholds()
 
     def _calculate_displacement(self, state: ObjectMovementState) -> Tuple[float, float]:
         """
@@ -176,9 +207,7 @@ class MovementDetector:
 
         Uses OR logic: moved if EITHER x OR y displacement exceeds threshold.
         """
-        threshold_x = self._get_threshold_x()
-        threshold_y = self._get_threshold_y()
-        return dx > threshold_x or dy > threshold_y
+        return dx > self._threshold_x or dy > self._threshold_y
 
     def _is_within_threshold(self, dx: float, dy: float, use_tolerance: bool = False) -> bool:
         """
@@ -196,17 +225,13 @@ class MovementDetector:
         Returns:
             True if object is within threshold (close to home position)
         """
-        threshold_x = self._get_threshold_x()
-        threshold_y = self._get_threshold_y()
-        
         if use_tolerance:
             # Use 50% of threshold - object must be genuinely close to home
             # This creates hysteresis: MOVED triggers at 100% threshold,
             # RETURNED triggers at 50% threshold (must be closer to home)
-            threshold_x *= 0.5
-            threshold_y *= 0.5
-        
-        return dx <= threshold_x and dy <= threshold_y
+            return dx <= self._threshold_x_half and dy <= self._threshold_y_half
+
+        return dx <= self._threshold_x and dy <= self._threshold_y
 
     def _get_bbox_center(self, bbox: Tuple[int, int, int, int]) -> Tuple[float, float]:
         """
@@ -250,6 +275,8 @@ class MovementDetector:
             home_bbox=bbox,
             current_x=center_x,
             current_y=center_y,
+            smoothed_x=center_x,
+            smoothed_y=center_y,
             is_moved=False,
             was_ever_moved=False,
             behavioral_state=BehavioralState.PRESENT,
@@ -260,6 +287,7 @@ class MovementDetector:
         )
 
         self.object_states[key] = state
+        self._moved_keys.pop(key, None)  # Re-registering replaces any previous state
         print(f"  [Movement] Registered {class_name} at home ({center_x:.0f}, {center_y:.0f})")
 
         return state
@@ -279,23 +307,22 @@ class MovementDetector:
         """
         key = (view_angle, class_name)
 
-        if key not in self.object_states:
+        state = self.object_states.get(key)
+        if state is None:
             return None
 
-        state = self.object_states[key]
-        center_x, center_y = self._get_bbox_center(bbox)
+        # Helpers (_get_bbox_center, _calculate_displacement, threshold checks) are
+        # inlined here: this runs for every tracked detection on every frame
+        x, y, w, h = bbox
+        center_x = x + w / 2.0
+        center_y = y + h / 2.0
         current_time = time.time()
 
         # Apply EMA smoothing to bbox center to reduce jitter
-        if state.smoothed_x == 0.0:
-            # First time - initialize smoothed position
-            state.smoothed_x = center_x
-            state.smoothed_y = center_y
-        else:
-            # Smooth the position (alpha=0.3 means 30% new, 70% old)
-            alpha = 0.3
-            state.smoothed_x = alpha * center_x + (1 - alpha) * state.smoothed_x
-            state.smoothed_y = alpha * center_y + (1 - alpha) * state.smoothed_y
+        # (alpha=0.3 means 30% new, 70% old; register_object seeds it with the home position)
+        alpha = 0.3
+        state.smoothed_x = alpha * center_x + (1 - alpha) * state.smoothed_x
+        state.smoothed_y = alpha * center_y + (1 - alpha) * state.smoothed_y
 
         # Update current position to smoothed values
         state.current_x = state.smoothed_x
@@ -303,14 +330,21 @@ class MovementDetector:
         state.last_seen_time = current_time
 
         # Calculate displacement from home
-        dx, dy = self._calculate_displacement(state)
-
-        # Check if still in stabilization period
-        time_since_registered = current_time - state.first_seen_time
-        in_stabilization = time_since_registered < self.stabilization_time
+        dx = abs(state.current_x - state.home_x)
+        dy = abs(state.current_y - state.home_y)
 
         # Check movement state transitions (only transition to moved, never back)
         if not state.is_moved:
+            # Fast path for the common case: an unmoved object still within the threshold
+            # cannot transition, whatever its stabilization or cooldown state
+            # (a pending cooldown timestamp still goes through the checks below to be cleared)
+            if dx <= self._threshold_x and dy <= self._threshold_y and state.last_cart_abandoned_time is None:
+                return state
+
+            # Check if still in stabilization period
+            time_since_registered = current_time - state.first_seen_time
+            in_stabilization = time_since_registered < self.stabilization_time
+
             # Skip movement detection during stabilization period
             if in_stabilization:
                 # Don't update home - just skip movement detection during stabilization
@@ -334,11 +368,12 @@ class MovementDetector:
                     # Cooldown expired - clear the timestamp and allow detection
                     state.last_cart_abandoned_time = None
 
-            # Check if object has moved beyond threshold
-            if self._is_beyond_threshold(dx, dy):
+            # Check if object has moved beyond threshold (either axis)
+            if dx > self._threshold_x or dy > self._threshold_y:
                 state.is_moved = True
                 state.was_ever_moved = True
                 state.moved_time = current_time
+                self._moved_keys[key] = None
                 state.behavioral_state = BehavioralState.MOVED
 
                 print(f"  [Movement] {class_name} MOVED! Displacement: ({dx:.0f}, {dy:.0f})px")
@@ -355,7 +390,8 @@ class MovementDetector:
 
         else:
             # Object was already moved - check if it returned to home
-            if self._is_within_threshold(dx, dy, use_tolerance=True):
+            # (both axes within half the threshold, see _is_within_threshold)
+            if dx <= self._threshold_x_half and dy <= self._threshold_y_half:
                 # Object returned to home position!
                 print(f"  [Movement] {class_name} RETURNED to home! -> CART_ABANDONED")
 
@@ -376,6 +412,7 @@ class MovementDetector:
                 state.is_moved = False
                 state.was_ever_moved = False
                 state.moved_time = None
+                self._moved_keys.pop(key, None)
                 state.last_cart_abandoned_time = current_time  # Start cooldown
                 state.behavioral_state = BehavioralState.PRESENT  # Reset to allow new events
 
@@ -388,8 +425,9 @@ class MovementDetector:
         Returns:
             List of behavioral event dictionaries
         """
-        events = self.pending_events.copy()
-        self.pending_events.clear()
+        # Hand over the list itself and start a fresh one (no copy)
+        events = self.pending_events
+        self.pending_events = []
         return events
 
     def get_object_state(self, view_angle: int, class_name: str) -> Optional[ObjectMovementState]:
@@ -404,12 +442,13 @@ class MovementDetector:
     def reset_object(self, view_angle: int, class_name: str):
         """Reset tracking for a specific object"""
         key = (view_angle, class_name)
-        if key in self.object_states:
-            del self.object_states[key]
+        self.object_states.pop(key, None)
+        self._moved_keys.pop(key, None)
 
     def reset_all(self):
         """Reset all tracking state"""
         self.object_states.clear()
+        self._moved_keys.clear()
         self.pending_events.clear()
         self.person_proximity.clear()
         print("[MovementDetector] Reset all tracking state")
@@ -434,17 +473,13 @@ class MovementDetector:
         events = []
         keys_to_clear = []
 
-        for key, state in self.object_states.items():
+        # Only moved objects can time out
+        for key in self._moved_keys:
+            state = self.object_states[key]
             view_angle, class_name = key
 
-            # Skip if not moved or already has a behavioral event
-            if not state.is_moved:
-                continue
-
             # Skip if already triggered a main event (WINDOW_SHOPPED, CART_ABANDONED, PURCHASED)
-            if state.behavioral_state in (BehavioralState.WINDOW_SHOPPED,
-                                          BehavioralState.CART_ABANDONED,
-                                          BehavioralState.PRODUCT_PURCHASED):
+            if state.behavioral_state in _TERMINAL_STATES:
                 continue
 
             # Check if timeout has elapsed since moved
@@ -484,13 +519,14 @@ class MovementDetector:
             key: (view_angle, class_name) tuple
             event_type: The event type that triggered this clear (for logging)
         """
-        if key in self.object_states:
-            state = self.object_states[key]
+        state = self.object_states.get(key)
+        if state is not None:
             current_time = time.time()
             
             # Reset movement flags but KEEP was_ever_moved=True
             # This allows PRODUCT_PURCHASED to fire if object exits after timeout CART_ABANDONED
             state.is_moved = False
+            self._moved_keys.pop(key, None)
             # Note: was_ever_moved stays True so EXIT → PRODUCT_PURCHASED works
             state.moved_time = None
             
@@ -505,11 +541,7 @@ class MovementDetector:
 
         # Also clear person proximity state
         if key in self.person_proximity:
-            self.person_proximity[key] = {
-                'person_triggered': False,
-                'last_person_time': None,
-                'trigger_count': 0
-            }
+            self.person_proximity[key] = PersonProximityState()
 
     # ==================== Person Proximity Tracking ====================
     # For WINDOW_SHOPPED: tracks when a 'person' is detected near an object
@@ -541,23 +573,19 @@ class MovementDetector:
         current_time = time.time()
 
         # Initialize tracking if needed
-        if key not in self.person_proximity:
-            self.person_proximity[key] = {
-                'person_triggered': False,
-                'person_first_seen': None,
-                'trigger_count': 0
-            }
+        prox_state = self.person_proximity.get(key)
+        if prox_state is None:
+            prox_state = self.person_proximity[key] = PersonProximityState()
 
-        prox_state = self.person_proximity[key]
-        was_triggered = prox_state['person_triggered']
+        was_triggered = prox_state.person_triggered
 
         if person_bbox is not None:
             # Person is in frame
             if not was_triggered:
                 # Person just entered frame
-                prox_state['person_triggered'] = True
-                prox_state['person_first_seen'] = current_time
-                prox_state['trigger_count'] += 1
+                prox_state.person_triggered = True
+                prox_state.person_first_seen = current_time
+                prox_state.trigger_count += 1
                 print(f"  [Person] Person IN FRAME with {object_class} -> person_triggered=True")
                 return True
 
@@ -565,11 +593,11 @@ class MovementDetector:
             # No person in frame
             if was_triggered:
                 # Person was in frame, now left
-                person_duration = current_time - prox_state['person_first_seen']
+                person_duration = current_time - prox_state.person_first_seen
 
                 if person_duration >= 4.0:
                     # Person was in frame for >= 4 seconds -> WINDOW_SHOPPED
-                    prox_state['person_triggered'] = False
+                    prox_state.person_triggered = False
                     print(f"  [Person] Person LEFT FRAME (duration: {person_duration:.1f}s) -> WINDOW_SHOPPED")
 
                     # Get object state to build event
@@ -585,7 +613,7 @@ class MovementDetector:
                             'view_angle': view_angle,
                             'time_present_seconds': current_time - state.first_seen_time,
                             'person_duration_seconds': person_duration,
-                            'person_interaction_count': prox_state.get('trigger_count', 1),
+                            'person_interaction_count': prox_state.trigger_count,
                             'timestamp': current_time
                         }
                         self.pending_events.append(event)
@@ -597,7 +625,7 @@ class MovementDetector:
                         return True
                 else:
                     # Person left but was only there for < 4 seconds - no event
-                    prox_state['person_triggered'] = False
+                    prox_state.person_triggered = False
                     print(f"  [Person] Person LEFT FRAME (duration: {person_duration:.1f}s) - too short, no event")
                     return True
 
@@ -622,7 +650,7 @@ class MovementDetector:
 
         return dx <= threshold_x and dy <= threshold_y
 
-    def get_person_proximity_state(self, view_angle: int, class_name: str) -> Optional[Dict]:
+    def get_person_proximity_state(self, view_angle: int, class_name: str) -> Optional[PersonProximityState]:
         """Get person proximity state for an object"""
         key = (view_angle, class_name)
         return self.person_proximity.get(key)
@@ -645,10 +673,12 @@ class MovementDetector:
         """
         key = (view_angle, class_name)
 
-        if key not in self.object_states:
+        # Remove object from tracking (single lookup; returns None if not tracked)
+        state = self.object_states.pop(key, None)
+        if state is None:
             return None
+        self._moved_keys.pop(key, None)
 
-        state = self.object_states[key]
         current_time = time.time()
 
         event = None
@@ -676,11 +706,7 @@ class MovementDetector:
                 print(f"  [Movement] {class_name} EXIT (no person interaction) -> PRODUCT_PURCHASED")
 
         # Clean up person proximity tracking
-        if key in self.person_proximity:
-            del self.person_proximity[key]
-
-        # Remove object from tracking
-        del self.object_states[key]
+        self.person_proximity.pop(key, None)
 
         return event
 
@@ -5,9 +5,40 @@ import numpy as np
 import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import List, Dict, Tuple, Optional
 
 
+@lru_cache(maxsize=256)
+def _text_size(text: str, scale: float, thickness: int) -> Tuple[int, int]:
+    """Cached cv2.getTextSize for overlay labels, which repeat on every redraw."""
+    return cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)[0]
+
+
+def _outline_strips(x1: int, y1: int, x2: int, y2: int, thickness: int,
+                    shape: Tuple[int, ...]) -> List[Tuple[int, int, int, int]]:
+    """
+    Pixel regions (x1, y1, x2, y2, end-exclusive) that a cv2.rectangle outline
+    of the given thickness can touch, clipped to an image of the given shape.
+    """
+    x1, x2 = min(x1, x2), max(x1, x2)
+    y1, y2 = min(y1, y2), max(y1, y2)
+    m = thickness // 2 + 2
+    height, width = shape[:2]
+
+    strips = []
+    for sx1, sy1, sx2, sy2 in ((x1 - m, y1 - m, x2 + m + 1, y1 + m + 1),   # top
+                               (x1 - m, y2 - m, x2 + m + 1, y2 + m + 1),   # bottom
+                               (x1 - m, y1 - m, x1 + m + 1, y2 + m + 1),   # left
+                               (x2 - m, y1 - m, x2 + m + 1, y2 + m + 1)):  # right
+        sx1, sy1 = max(sx1, 0), max(sy1, 0)
+        sx2, sy2 = min(sx2, width), min(sy2, height)
+        if sx1 < sx2 and sy1 < sy2:
+            strips.append((sx1, sy1, sx2, sy2))
+    return strips
+
+
 class RelabelingGUI:
     """Separate Tkinter GUI for object relabeling interface."""
 
@@ -122,11 +153,12 @@ class RelabelingGUI:
             widget.destroy()
         self.label_entries = []
 
-        for i, obj in enumerate(selected_objects):
-            # Add to listbox
-            list_text = f"ID {obj['object_id']:3d} | {obj['class_name']:15s} | conf={obj['confidence']:.2f}"
-            self.objects_listbox.insert(tk.END, list_text)
+        # Add to listbox in a single insert (one Tcl call and one relayout for all rows)
+        self.objects_listbox.insert(tk.END, *(
+            f"ID {obj['object_id']:3d} | {obj['class_name']:15s} | conf={obj['confidence']:.2f}"
+            for obj in selected_objects))
 
+        for i, obj in enumerate(selected_objects):
             # Create label entry for relabel mode
             entry_frame = ttk.Frame(self.label_entries_frame)
             entry_frame.pack(fill=tk.X, pady=2)
@@ -234,13 +266,17 @@ class ObjectRelabelingSystem:
 
         # Capture state
         self.captured_frame = None
-        self.captured_detections = []  # YOLO detections with object_ids
+        self.captured_detections = ()  # YOLO detections with object_ids (immutable per capture)
+        # Column view of the captured detection centers, built once per capture for box selection
+        self._center_rows = []  # Index into captured_detections for each row of _centers
+        self._centers = np.empty((0, 2), dtype=np.int32)
         self.is_frozen = False
 
         # Selection state
         self.selection_bbox = None
         self.drawing = False
         self.start_point = None
+        self._pending_mouse = None  # Latest drag position, applied once per drawn frame
         self.selected_objects = []  # Objects within selection box
 
         # Mode state (controlled by GUI radio buttons)
@@ -252,6 +288,21 @@ class ObjectRelabelingSystem:
         self.frame_width = 1920
         self.frame_height = 1080
 
+        # Off-thread rendering: one worker draws into two alternating buffers,
+        # get_visualization hands back the last finished one without waiting
+        self._render_pool = ThreadPoolExecutor(max_workers=1)
+        self._render_future = None
+        self._render_buffers = [None, None]
+        self._render_index = 0
+        self._render_generation = 0  # Bumped on capture/resume so stale renders are dropped
+
+        # Render-thread state: the frame with the static detection boxes drawn once per
+        # capture, and per buffer the strips the last selection overlay touched
+        self._render_base = None
+        self._render_base_generation = -1
+        self._render_dirty = [None, None]  # None = whole buffer must be refreshed from the base
+        self._latest_vis = None
+
         # GUI
         self.gui = RelabelingGUI(
             parent=self.tk_root,
@@ -259,26 +310,48 @@ class ObjectRelabelingSystem:
             on_cancel_callback=self._on_gui_cancel
         )
 
-    def capture_frame(self, rgb_frame: np.ndarray, detections: List[Dict], object_ids: List[int]):
+    def capture_frame(self, bgr_frame: np.ndarray, detections: List[Dict], object_ids: List[int],
+                      copy: bool = False):
         """
         Capture and freeze the current frame with detections.
 
+        By default the frame is kept by reference (as a read-only view) rather
+        than copied, so the caller must leave the buffer unchanged until
+        resume_live_feed. The main loop does: it captures the Kinect's front
+        buffer and stops calling get_frames while frozen. Pass copy=True when
+        the buffer may be reused before then.
+
         Args:
-            rgb_frame: Current RGB frame from Kinect
+            bgr_frame: Current BGR frame from Kinect
             detections: List of current detections
             object_ids: List of object IDs corresponding to detections
+            copy: Copy the frame instead, if the caller keeps reusing its buffer
         """
-        self.captured_frame = rgb_frame.copy()
+        if bgr_frame is None:
+            raise ValueError("capture_frame needs a frame to freeze")
+
+        if copy:
+            self.captured_frame = bgr_frame.copy()
+        else:
+            # Read-only view guards the capture; the caller's buffer itself stays writable
+            self.captured_frame = bgr_frame.view()
+            self.captured_frame.flags.writeable = False
         self.is_frozen = True
         self.selection_bbox = None
         self.selected_objects = []
 
-        # Combine detections with their object IDs
-        self.captured_detections = []
-        for det, obj_id in zip(detections, object_ids):
-            det_with_id = det.copy()
-            det_with_id['object_id'] = obj_id
-            self.captured_detections.append(det_with_id)
+        # Combine detections with their object IDs; a tuple, so the render thread can
+        # read it without a snapshot copy and callers cannot change the frozen set
+        self.captured_detections = tuple({**det, 'object_id': obj_id}
+                                         for det, obj_id in zip(detections, object_ids))
+
+        self._center_rows = [i for i, det in enumerate(self.captured_detections)
+                             if det.get('center_2d') is not None]
+        self._centers = np.array([self.captured_detections[i]['center_2d'] for i in self._center_rows],
+                                 dtype=np.int32).reshape(-1, 2)
+
+        self._render_generation += 1
+        self._latest_vis = None
 
         print(f"\n[CAPTURE] Frame frozen. Draw a box to select objects. Press 'R' to resume.")
 
@@ -287,24 +360,25 @@ class ObjectRelabelingSystem:
         if not self.is_frozen:
             return
 
-        # Scale mouse coordinates
-        scale_x = self.frame_width / self.display_width
-        scale_y = self.frame_height / self.display_height
-        frame_x = int(x * scale_x)
-        frame_y = int(y * scale_y)
+        # Scale mouse coordinates (exact integer ratio, no float rounding)
+        frame_x = x * self.frame_width // self.display_width
+        frame_y = y * self.frame_height // self.display_height
 
         if event == cv2.EVENT_LBUTTONDOWN:
             self.drawing = True
             self.start_point = (frame_x, frame_y)
+            self._pending_mouse = None
             self.selection_bbox = None
             self.selected_objects = []
 
         elif event == cv2.EVENT_MOUSEMOVE:
             if self.drawing:
-                self.selection_bbox = (self.start_point[0], self.start_point[1], frame_x, frame_y)
+                # Mouse events can arrive far faster than frames; only the last one matters
+                self._pending_mouse = (frame_x, frame_y)
 
         elif event == cv2.EVENT_LBUTTONUP:
             self.drawing = False
+            self._pending_mouse = None
             if self.start_point is not None:
                 x1, y1 = self.start_point
                 x2, y2 = frame_x, frame_y
@@ -321,6 +395,13 @@ class ObjectRelabelingSystem:
                     print("\n[WARNING] Box too small.")
                     self.selection_bbox = None
 
+    def tick(self):
+        """Apply the latest drag position to the selection box (once per frame)."""
+        if self._pending_mouse is not None:
+            if self.drawing:
+                self.selection_bbox = (self.start_point[0], self.start_point[1], *self._pending_mouse)
+            self._pending_mouse = None
+
     def _select_objects_in_box(self):
         """Find all detected objects whose centers are within the selection box."""
         if not self.selection_bbox:
@@ -328,34 +409,40 @@ class ObjectRelabelingSystem:
 
         sx1, sy1, sx2, sy2 = self.selection_bbox
         self.selected_objects = []
-        seen_object_ids = set()  # Prevent duplicates
-
-        for det in self.captured_detections:
-            if 'center_2d' in det and det['center_2d'] is not None:
-                cx, cy = det['center_2d']
-                # Check if center is within selection box
-                if sx1 <= cx <= sx2 and sy1 <= cy <= sy2:
-                    # Skip if we've already added this object_id
-                    if det['object_id'] in seen_object_ids:
-                        continue
-
-                    # Get full object info from database
-                    obj = self.db.get_object(det['object_id'])
-                    if obj:
-                        seen_object_ids.add(det['object_id'])
-                        self.selected_objects.append({
-                            'object_id': det['object_id'],
-                            'class_name': obj['class_name'],
-                            'confidence': obj['avg_confidence'],
-                            'detection_count': obj['detection_count'],
-                            'bbox': det.get('bbox'),
-                            'center_2d': det['center_2d']
-                        })
+
+        if self._center_rows:
+            # Test every center against the selection box in one NumPy pass
+            centers = self._centers
+            inside = ((centers[:, 0] >= sx1) & (centers[:, 0] <= sx2) &
+                      (centers[:, 1] >= sy1) & (centers[:, 1] <= sy2))
+
+            # Keep the first detection per object_id (prevents duplicates)
+            hits = {}
+            for i in np.flatnonzero(inside):
+                det = self.captured_detections[self._center_rows[i]]
+                hits.setdefault(det['object_id'], det)
+
+            # Get full object info from database in one query
+            objects = self.db.get_objects(list(hits))
+
+            for object_id, det in hits.items():
+                obj = objects.get(object_id)
+                if obj:
+                    self.selected_objects.append({
+                        'object_id': object_id,
+                        'class_name': obj['class_name'],
+                        'confidence': obj['avg_confidence'],
+                        'detection_count': obj['detection_count'],
+                        'bbox': det.get('bbox'),
+                        'center_2d': det['center_2d']
+                    })
 
         if self.selected_objects:
-            print(f"\n[SELECTED] {len(self.selected_objects)} object(s)")
-            for i, obj in enumerate(self.selected_objects, 1):
-                print(f"  {i}. ID={obj['object_id']} | {obj['class_name']} (conf={obj['confidence']:.2f})")
+            # One write for the whole listing rather than a print per object
+            lines = [f"\n[SELECTED] {len(self.selected_objects)} object(s)"]
+            lines.extend(f"  {i}. ID={obj['object_id']} | {obj['class_name']} (conf={obj['confidence']:.2f})"
+                         for i, obj in enumerate(self.selected_objects, 1))
+            print("\n".join(lines))
 
             # Populate table dropdown with existing tables
             all_groups = self.db.get_all_groups()
@@ -386,25 +473,25 @@ class ObjectRelabelingSystem:
     def _save_relabel_from_gui(self):
         """Save label changes from GUI."""
         updated_labels = self.gui.get_updated_labels()
-        print(f"\n[SAVING] Updating {len(updated_labels)} object(s)...")
+
+        # Progress lines are collected and written once after the commit
+        lines = [f"\n[SAVING] Updating {len(updated_labels)} object(s)..."]
 
         updated_count = 0
-        for object_id, new_label in updated_labels.items():
-            if not new_label:
-                continue
-            try:
-                self.db.conn.execute("""
-                    UPDATE objects
-                    SET class_name = ?
-                    WHERE object_id = ?
-                """, (new_label, object_id))
-                print(f"  [OK] Object ID {object_id} -> '{new_label}'")
-                updated_count += 1
-            except Exception as e:
-                print(f"  [ERROR] Failed to update object {object_id}: {e}")
-
-        self.db.conn.commit()
-        print(f"\n[SUCCESS] {updated_count} object(s) updated")
+        # One transaction, so the relabels land in a single commit
+        with self.db.transaction():
+            for object_id, new_label in updated_labels.items():
+                if not new_label:
+                    continue
+                try:
+                    self.db.update_object_class(object_id, new_label)
+                    lines.append(f"  [OK] Object ID {object_id} -> '{new_label}'")
+                    updated_count += 1
+                except Exception as e:
+                    lines.append(f"  [ERROR] Failed to update object {object_id}: {e}")
+
+        lines.append(f"\n[SUCCESS] {updated_count} object(s) updated")
+        print("\n".join(lines))
 
         self.gui.show_message(f"Updated {updated_count} object(s)!", success=True)
         self.gui.hide()
@@ -472,9 +559,13 @@ class ObjectRelabelingSystem:
         """Resume the live feed."""
         self.is_frozen = False
         self.captured_frame = None
-        self.captured_detections = []
+        self.captured_detections = ()
+        self._center_rows = []
+        self._centers = np.empty((0, 2), dtype=np.int32)
         self.selection_bbox = None
         self.selected_objects = []
+        self._render_generation += 1
+        self._latest_vis = None
         self.gui.hide()
         print("\n[RESUME] Returning to live feed...")
 
@@ -482,16 +573,97 @@ class ObjectRelabelingSystem:
         """
         Get the current visualization showing bounding boxes only.
 
+        Drawing runs on a worker thread so mouse and Tk events are not held up
+        by it; this returns the most recently finished frame (blocking only for
+        the first one after a capture) and queues a redraw of the current state.
+
         Returns:
             Annotated frame or None if not frozen
         """
         if not self.is_frozen or self.captured_frame is None:
             return None
 
-        vis = self.captured_frame.copy()
+        self.tick()
+
+        future = self._render_future
+        if future is not None and (future.done() or self._latest_vis is None):
+            generation, vis = future.result()
+            self._render_future = None
+            if generation == self._render_generation:
+                self._latest_vis = vis
+
+        if self._render_future is None:
+            # Render into the buffer that is not currently handed out
+            self._render_index ^= 1
+
+            # Snapshot the state: the mouse callback keeps mutating it meanwhile
+            self._render_future = self._render_pool.submit(
+                self._render, self._render_generation, self.captured_frame,
+                self.captured_detections, self.selection_bbox,
+                list(self.selected_objects), self._render_index)
+
+            if self._latest_vis is None:
+                generation, self._latest_vis = self._render_future.result()
+                self._render_future = None
+
+        return self._latest_vis
+
+    def _render(self, generation, frame, detections, selection_bbox, selected_objects, index):
+        """
+        Draw detections and selection state for one frame (runs on the render thread).
+
+        The gray detection boxes only change on capture, so they are drawn once
+        into a base image. Each buffer then only has the strips covered by its
+        previous selection overlay restored from the base, instead of a full
+        frame copy per redraw.
+        """
+        if self._render_base_generation != generation:
+            self._render_base = self._render_static(frame, detections)
+            self._render_base_generation = generation
+            self._render_dirty = [None, None]
+        base = self._render_base
+
+        vis = self._render_buffers[index]
+        if vis is None or vis.shape != base.shape:
+            vis = self._render_buffers[index] = np.empty_like(base)
+            self._render_dirty[index] = None
+
+        dirty = self._render_dirty[index]
+        if dirty is None:
+            np.copyto(vis, base)
+        else:
+            for x1, y1, x2, y2 in dirty:
+                vis[y1:y2, x1:x2] = base[y1:y2, x1:x2]
+
+        dirty = []
+
+        # Draw selection box (yellow)
+        if selection_bbox:
+            x1, y1, x2, y2 = selection_bbox
+            cv2.rectangle(vis, (x1, y1), (x2, y2), (0, 255, 255), 3)
+            dirty.extend(_outline_strips(x1, y1, x2, y2, 3, vis.shape))
+
+        # Highlight selected objects (green)
+        if selected_objects:
+            for obj in selected_objects:
+                if 'bbox' in obj and obj['bbox']:
+                    # bbox is (x, y, w, h) format
+                    x, y, w, h = obj['bbox']
+                    x1, y1 = x, y
+                    x2, y2 = x + w, y + h
+                    cv2.rectangle(vis, (x1, y1), (x2, y2), (0, 255, 0), 3)
+                    dirty.extend(_outline_strips(x1, y1, x2, y2, 3, vis.shape))
+
+        self._render_dirty[index] = dirty
+        return generation, vis
+
+    @staticmethod
+    def _render_static(frame, detections):
+        """Copy frame and draw the captured detections (gray boxes with labels) onto it."""
+        vis = frame.copy()
 
         # Draw all detected objects (gray boxes)
-        for det in self.captured_detections:
+        for det in detections:
             if 'bbox' in det:
                 # bbox is (x, y, w, h) format
                 x, y, w, h = det['bbox']
@@ -503,24 +675,9 @@ class ObjectRelabelingSystem:
                 label = det.get('class_name', 'unknown')
                 conf = det.get('confidence', 0.0)
                 label_text = f"{label} {conf:.2f}"
-                (tw, th), _ = cv2.getTextSize(label_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+                tw, th = _text_size(label_text, 0.5, 1)
                 cv2.rectangle(vis, (x1, y1 - th - 6), (x1 + tw + 6, y1), (180, 180, 180), -1)
                 cv2.putText(vis, label_text, (x1 + 3, y1 - 3),
                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
 
-        # Draw selection box (yellow)
-        if self.selection_bbox:
-            x1, y1, x2, y2 = self.selection_bbox
-            cv2.rectangle(vis, (x1, y1), (x2, y2), (0, 255, 255), 3)
-
-        # Highlight selected objects (green)
-        if self.selected_objects:
-            for obj in self.selected_objects:
-                if 'bbox' in obj and obj['bbox']:
-                    # bbox is (x, y, w, h) format
-                    x, y, w, h = obj['bbox']
-                    x1, y1 = x, y
-                    x2, y2 = x + w, y + h
-                    cv2.rectangle(vis, (x1, y1), (x2, y2), (0, 255, 0), 3)
-
         return vis
@@ -1,11 +1,33 @@
 """Remote Grounding DINO Detector - Compatible with backend.py"""
 
 import cv2
-import base64
 import requests
+from requests.adapters import HTTPAdapter
 import time
+import queue
+import zlib
 import numpy as np
-from threading import Thread, Lock
+from functools import lru_cache
+from threading import Thread, Lock, BoundedSemaphore
+
+# Optional libjpeg-turbo encoder (pip install PyTurboJPEG); falls back to cv2.imencode
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+except ImportError:
+    TurboJPEG = None
+
+
+@lru_cache(maxsize=16)
+def _parse_classes(text_prompt):
+    """Split a text prompt into a tuple of class names (cached; the prompt rarely changes)"""
+    return tuple(c.strip() for c in text_prompt.replace(',', '.').split('.') if c.strip())
+
+
+@lru_cache(maxsize=256)
+def _class_color(class_name):
+    """Consistent BGR color for a class name (stable across runs, no global RNG use)"""
+    h = zlib.crc32(class_name.encode('utf-8'))
+    return (50 + (h & 0xFF) % 205, 50 + ((h >> 8) & 0xFF) % 205, 50 + ((h >> 16) & 0xFF) % 205)
 
 
 class RemoteGroundingDinoDetector:
@@ -15,7 +37,8 @@ class RemoteGroundingDinoDetector:
     """
 
     def __init__(self, classes, confidence=0.60, endpoint=None, model='grounding-dino-tiny',
-                 resize_width=1920, jpeg_quality=100):
+                 resize_width=1920, jpeg_quality=100, max_in_flight=2,
+                 adaptive_quality=False, target_latency=0.08):
         """
         Initialize remote Grounding DINO detector
 
@@ -26,6 +49,10 @@ class RemoteGroundingDinoDetector:
             model: Model name (for display only)
             resize_width: Resize frames to this width for faster upload
             jpeg_quality: JPEG quality for compression (1-100)
+            max_in_flight: Maximum number of frames being encoded/sent at once
+            adaptive_quality: Lower/raise JPEG quality and upload width to track target_latency
+                              (resize_width and jpeg_quality act as the upper bounds)
+            target_latency: Target request round-trip time in seconds for adaptive quality
         """
         self.classes = classes
         self.confidence = confidence
@@ -42,20 +69,65 @@ class RemoteGroundingDinoDetector:
         # Convert classes to text prompt (Grounding DINO open vocabulary format)
         self.text_prompt = ". ".join(classes)
 
+        # Adaptive quality: step through widths at or below the configured width
+        self.adaptive_quality = adaptive_quality
+        self.target_latency = target_latency
+        self.max_jpeg_quality = jpeg_quality
+        self.width_steps = sorted({w for w in (resize_width, 1280, 960, 720)
+                                   if resize_width is not None and w <= resize_width}, reverse=True)
+        self.width_index = 0
+        self.latency_ema = None
+        # Steps need this many consecutive over/under-budget responses, so quality does not oscillate
+        self.adapt_samples = 10
+        self.adapt_streak = 0  # > 0: consecutive responses over budget, < 0: under budget
+
+        # JPEG encoder backend
+        self.turbo_jpeg = None
+        if TurboJPEG is not None:
+            try:
+                self.turbo_jpeg = TurboJPEG()
+            except (OSError, RuntimeError) as e:
+                print(f"⚠ TurboJPEG unavailable ({e}), using OpenCV JPEG encoder")
+
+        # Reused HTTP session (keeps the TCP/TLS connection alive between frames).
+        # urllib3 already sets TCP_NODELAY on its sockets, so small requests go out immediately.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
         # Async detection
         self.lock = Lock()
         self.latest_detections = []
         self.latest_error = None
-        self.pending = False
-        self.thread = None
         self.new_results_ready = False  # Flag for new GPU results
 
+        # Pipeline: caller -> frame queue -> encoder thread -> encoded queue -> sender threads.
+        # The semaphore bounds frames in flight; new frames are skipped while it is exhausted.
+        self.max_in_flight = max_in_flight
+        self.in_flight = BoundedSemaphore(max_in_flight)
+        self.frame_queue = queue.Queue(maxsize=max_in_flight)
+        self.encoded_queue = queue.Queue(maxsize=max_in_flight)
+        self.frame_seq = 0  # Sequence number of the last submitted frame
+        self.latest_seq = 0  # Sequence number of the frame behind latest_detections
+        self.resize_buf = None  # Reused resize output (encoder thread only)
+        # Snapshot buffers recycled by the encoder (bounded by max_in_flight, plus one)
+        self.frame_pool = queue.Queue()
+
+        self.workers = [Thread(target=self._encode_worker, daemon=True)]
+        self.workers += [Thread(target=self._send_worker, daemon=True) for _ in range(max_in_flight)]
+        for worker in self.workers:
+            worker.start()
+
         print(f"[OK] Remote Grounding DINO initialized")
         print(f"  Endpoint: {self.endpoint}")
         print(f"  Classes: {len(self.classes)}")
         print(f"  Text prompt: {self.text_prompt}")
         print(f"  Confidence: {self.confidence:.2f}")
         print(f"  Resolution: {self.resize_width}px")
+        print(f"  JPEG encoder: {'TurboJPEG' if self.turbo_jpeg else 'OpenCV'}")
+        if self.adaptive_quality:
+            print(f"  Adaptive quality: target {self.target_latency * 1000:.0f}ms")
 
     def update_classes(self, new_classes):
         """
@@ -67,14 +139,14 @@ class RemoteGroundingDinoDetector:
             self.text_prompt = ". ".join(new_classes)
         print(f"✓ Updated classes: {self.text_prompt}")
 
-    def detect_with_depth(self, rgb_frame, depth_frame, kinect, pan_angle=None):
+    def detect_with_depth(self, bgr_frame, depth_frame, kinect, pan_angle=None):
         """
         Main detection method - compatible with backend.py
         Non-blocking: sends frame to GPU async, returns cached results immediately.
         ALWAYS-TRACK MODE: Estimates depth when unavailable, never skips objects.
 
         Args:
-            rgb_frame: RGB frame from Kinect (H, W, 3)
+            bgr_frame: BGR frame from Kinect (H, W, 3)
             depth_frame: Depth frame from Kinect (H, W) in mm
             kinect: KinectCamera instance for 3D calculations
             pan_angle: Optional pan servo angle (0, 90, 180) for world coordinate transformation
@@ -87,7 +159,7 @@ class RemoteGroundingDinoDetector:
             - is_new: True if these are fresh GPU results, False if cached
         """
         # Send to remote GPU (async, non-blocking - skips if GPU busy)
-        self._process_frame_async(rgb_frame)
+        self._process_frame_async(bgr_frame)
 
         # Check if new results are ready
         with self.lock:
@@ -101,154 +173,231 @@ class RemoteGroundingDinoDetector:
             print(f"⚠ Detection error: {error}")
             return [], is_new
 
-        # Add 3D information using depth frame (with estimation fallback)
-        for det in detections:
-            cx, cy = det['center']
-            det['center_2d'] = (cx, cy)
+        if not detections:
+            return detections, is_new
 
-            # Map color coordinates to depth coordinates
-            depth_x, depth_y = kinect.map_color_to_depth(cx, cy)
+        # Add 3D information using depth frame (with estimation fallback), one NumPy pass per frame
+        centers = np.array([det['center'] for det in detections], dtype=np.int64)
+        depth_xs, depth_ys = kinect.map_color_to_depth_batch(centers[:, 0], centers[:, 1])
+        depths = depth_frame[depth_ys, depth_xs].astype(np.float64)
 
-            # Try to get real depth value
-            depth_mm = None
-            depth_source = 'unknown'
-            
-            if 0 <= depth_y < depth_frame.shape[0] and 0 <= depth_x < depth_frame.shape[1]:
-                depth_mm = depth_frame[depth_y, depth_x]
+        sources = []
+        to_estimate = []
+        for i, det in enumerate(detections):
+            cx, cy = det['center']
+            det['center_2d'] = (cx, cy)
 
-            if depth_mm and depth_mm > 0:
+            if depths[i] > 0:
                 # Real depth available - use it
-                center_3d = kinect.pixel_to_3d(depth_x, depth_y, depth_mm, pan_angle=pan_angle)
-                det['center_3d'] = center_3d
-                det['depth_source'] = 'real'
-            else:
+                sources.append('real')
+            elif det.get('bbox'):
                 # No depth available - ESTIMATE IT (never skip!)
-                # Use bbox and class name for intelligent estimation
-                bbox = det.get('bbox')
-                class_name = det.get('class_name')
-                
-                if bbox:
-                    # Estimate depth using kinect's estimation method
-                    estimated_depth = kinect.estimate_depth(
-                        bbox=bbox,
-                        class_name=class_name,
-                        last_known_depth=None  # Tracker will provide this via state
-                    )
-                    
-                    # Convert 2D center to 3D using estimated depth
-                    center_3d = kinect.pixel_to_3d(depth_x, depth_y, estimated_depth, pan_angle=pan_angle)
-                    det['center_3d'] = center_3d
-                    det['depth_source'] = 'estimated'
-                else:
-                    # No bbox (shouldn't happen) - set to None
-                    det['center_3d'] = None
-                    det['depth_source'] = 'unknown'
+                to_estimate.append(i)
+                sources.append('estimated')
+            else:
+                # No bbox (shouldn't happen)
+                sources.append('unknown')
+
+        if to_estimate:
+            # Use bbox and class name for intelligent estimation, all missing depths in one call
+            # (last known depth: tracker will provide this via state)
+            depths[to_estimate] = kinect.estimate_depth_batch(
+                [detections[i]['bbox'] for i in to_estimate],
+                class_names=[detections[i].get('class_name') for i in to_estimate]
+            )
+
+        # Convert all 2D centers to 3D in one call
+        points = kinect.pixels_to_3d(depth_xs, depth_ys, depths, pan_angle=pan_angle).tolist()
+        for det, point, source in zip(detections, points, sources):
+            det['center_3d'] = tuple(point) if source != 'unknown' else None
+            det['depth_source'] = source
 
         return detections, is_new
 
     def _process_frame_async(self, frame):
-        """Start async detection - non-blocking, skips if GPU is busy"""
-        with self.lock:
-            if self.pending:
-                return  # GPU busy, skip this frame (video keeps running smooth)
-            self.pending = True
-
-        # Start thread (non-blocking)
-        self.thread = Thread(target=self._detection_thread, args=(frame.copy(),))
-        self.thread.daemon = True
-        self.thread.start()
+        """Queue a frame for detection - non-blocking, skips if the pipeline is full"""
+        if not self.in_flight.acquire(blocking=False):
+            return  # GPU busy, skip this frame (video keeps running smooth)
 
-    def _detection_thread(self, frame):
-        """Background thread for remote detection"""
+        # The caller's frame buffer is reused on the next capture, so snapshot it into a
+        # recycled buffer instead of allocating a fresh full-resolution copy each time
         try:
-            # Resize frame for faster upload
-            if self.resize_width is not None:
-                h, w = frame.shape[:2]
-                new_h = int(h * (self.resize_width / w))
-                frame_resized = cv2.resize(frame, (self.resize_width, new_h))
-            else:
-                frame_resized = frame
+            snapshot = self.frame_pool.get_nowait()
+        except queue.Empty:
+            snapshot = None
+        if snapshot is None or snapshot.shape != frame.shape or snapshot.dtype != frame.dtype:
+            snapshot = np.empty_like(frame)
+        np.copyto(snapshot, frame)
+
+        self.frame_seq += 1
+        self.frame_queue.put_nowait((self.frame_seq, snapshot))
+
+    def _encode_worker(self):
+        """Pipeline stage: resize and JPEG-encode queued frames"""
+        while True:
+            seq, frame = self.frame_queue.get()
+            try:
+                with self.lock:
+                    resize_width = self.resize_width
+                    jpeg_quality = self.jpeg_quality
 
-            # Encode to JPEG
-            _, buffer = cv2.imencode('.jpg', frame_resized,
-                                    [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
-            img_b64 = base64.b64encode(buffer).decode('utf-8')
+                # Resize frame for faster upload (skipped when already at the target width)
+                h, w = frame.shape[:2]
+                if resize_width is not None and resize_width != w:
+                    new_h = int(h * (resize_width / w))
+                    # Safe to reuse: the frame is encoded before this thread resizes the next one
+                    if self.resize_buf is None or self.resize_buf.shape[:2] != (new_h, resize_width):
+                        self.resize_buf = np.empty((new_h, resize_width, 3), dtype=np.uint8)
+                    # INTER_AREA avoids aliasing on shrink (cleaner model input, smaller JPEG)
+                    frame_resized = cv2.resize(frame, (resize_width, new_h), dst=self.resize_buf,
+                                               interpolation=cv2.INTER_AREA)
+                else:
+                    frame_resized = frame
+
+                jpeg_bytes = self._encode_jpeg(frame_resized, jpeg_quality)
+
+                # Factors to scale detections back to original frame size
+                scale = (frame.shape[1] / frame_resized.shape[1],
+                         frame.shape[0] / frame_resized.shape[0])
+
+                self.encoded_queue.put((seq, jpeg_bytes, scale))
+            except Exception as e:
+                self._set_error(seq, str(e))
+                self.in_flight.release()
+            finally:
+                self.frame_pool.put(frame)
+
+    def _encode_jpeg(self, frame, quality):
+        """Encode a frame to JPEG bytes (4:2:0 chroma subsampling on both backends)"""
+        if self.turbo_jpeg is not None:
+            return self.turbo_jpeg.encode(frame, quality=quality,
+                                          pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes()
+
+    def _send_worker(self):
+        """Pipeline stage: send encoded frames to the GPU and publish results"""
+        while True:
+            seq, jpeg_bytes, scale = self.encoded_queue.get()
+            try:
+                self._send_frame(seq, jpeg_bytes, scale)
+            finally:
+                self.in_flight.release()
 
+    def _send_frame(self, seq, jpeg_bytes, scale):
+        """Send one encoded frame to the remote detector"""
+        try:
             # Convert text prompt to classes list
-            classes = [c.strip() for c in self.text_prompt.replace(',', '.').split('.') if c.strip()]
+            classes = _parse_classes(self.text_prompt)
+
+            # Send raw JPEG bytes (no base64/JSON wrapping); options go in the query string
+            send_time = time.time()
+            response = self.session.post(
+                self.endpoint,
+                data=jpeg_bytes,
+                params={"classes": classes, "confidence": self.confidence},
+                headers={"Content-Type": "image/jpeg"},
+                timeout=10
+            )
 
-            # Send request
-            response = requests.post(self.endpoint, json={
-                "input": {
-                    "image": img_b64,
-                    "classes": classes,
-                    "confidence": self.confidence
-                }
-            }, timeout=10)
+            if self.adaptive_quality:
+                self._adapt_quality(time.time() - send_time)
 
             # Check response status before parsing JSON
             if response.status_code != 200:
-                with self.lock:
-                    self.latest_detections = []
-                    self.latest_error = f"HTTP {response.status_code}: {response.text[:100]}"
+                self._set_error(seq, f"HTTP {response.status_code}: {response.text[:100]}")
                 return
 
             # Check for empty response
             if not response.text or len(response.text.strip()) == 0:
-                with self.lock:
-                    self.latest_detections = []
-                    self.latest_error = "Empty response from server (is the endpoint running?)"
+                self._set_error(seq, "Empty response from server (is the endpoint running?)")
                 return
 
             # Try to parse JSON
             try:
                 result = response.json()
             except Exception as json_err:
-                with self.lock:
-                    self.latest_detections = []
-                    self.latest_error = f"Invalid JSON: {response.text[:100]}"
+                self._set_error(seq, f"Invalid JSON: {response.text[:100]}")
                 return
 
             if "detections" in result:
                 detections = result["detections"]
 
-                # Scale detections back to original frame size if resized
-                if self.resize_width is not None:
-                    scale_x = frame.shape[1] / frame_resized.shape[1]
-                    scale_y = frame.shape[0] / frame_resized.shape[0]
-
-                    for det in detections:
-                        x, y, w, h = det["bbox"]
-                        det["bbox"] = (
-                            int(x * scale_x),
-                            int(y * scale_y),
-                            int(w * scale_x),
-                            int(h * scale_y)
-                        )
-                        cx, cy = det["center"]
-                        det["center"] = (int(cx * scale_x), int(cy * scale_y))
+                # Scale detections back to original frame size (scale is 1.0 if not resized)
+                if detections:
+                    scale_x, scale_y = scale
 
-                with self.lock:
-                    self.latest_detections = detections
-                    self.latest_error = None
-                    self.new_results_ready = True
+                    # Scale all boxes/centers in one NumPy pass (truncating like int())
+                    bboxes = (np.array([det["bbox"] for det in detections], dtype=np.float64)
+                              * (scale_x, scale_y, scale_x, scale_y)).astype(np.int32).tolist()
+                    centers = (np.array([det["center"] for det in detections], dtype=np.float64)
+                               * (scale_x, scale_y)).astype(np.int32).tolist()
+
+                    for det, bbox, center in zip(detections, bboxes, centers):
+                        det["bbox"] = tuple(bbox)
+                        det["center"] = tuple(center)
+
+                self._publish(seq, detections, None)
             else:
-                with self.lock:
-                    self.latest_detections = []
-                    self.latest_error = result.get("error", "Unknown error")
-                    self.new_results_ready = True
+                self._publish(seq, [], result.get("error", "Unknown error"))
 
         except requests.exceptions.Timeout:
-            with self.lock:
-                self.latest_detections = []
-                self.latest_error = "Request timeout"
+            self._set_error(seq, "Request timeout")
         except Exception as e:
-            with self.lock:
-                self.latest_detections = []
-                self.latest_error = str(e)
-        finally:
-            with self.lock:
-                self.pending = False
+            self._set_error(seq, str(e))
+
+    def _adapt_quality(self, latency):
+        """
+        Step JPEG quality and upload width toward the target round-trip latency.
+        After adapt_samples consecutive responses above 125% of target: quality -2
+        (min 40) and next smaller width. After as many below 75% of target: quality +2
+        and next larger width. Neither goes past the configured maximums.
+        """
+        with self.lock:
+            if self.latency_ema is None:
+                self.latency_ema = latency
+            else:
+                self.latency_ema = 0.8 * self.latency_ema + 0.2 * latency
+
+            if self.latency_ema > self.target_latency * 1.25:
+                self.adapt_streak = max(self.adapt_streak, 0) + 1
+            elif self.latency_ema < self.target_latency * 0.75:
+                self.adapt_streak = min(self.adapt_streak, 0) - 1
+            else:
+                self.adapt_streak = 0
+
+            if self.adapt_streak >= self.adapt_samples:
+                self.jpeg_quality = min(self.max_jpeg_quality, max(40, self.jpeg_quality - 2))
+                self.width_index = min(self.width_index + 1, len(self.width_steps) - 1)
+            elif self.adapt_streak <= -self.adapt_samples:
+                self.jpeg_quality = min(self.max_jpeg_quality, self.jpeg_quality + 2)
+                self.width_index = max(self.width_index - 1, 0)
+            else:
+                return
+            self.adapt_streak = 0
+
+            if self.width_steps:
+                self.resize_width = self.width_steps[self.width_index]
+
+    def _publish(self, seq, detections, error):
+        """Store results, ignoring responses older than the ones already published"""
+        with self.lock:
+            if seq < self.latest_seq:
+                return
+            self.latest_seq = seq
+            self.latest_detections = detections
+            self.latest_error = error
+            self.new_results_ready = True
+
+    def _set_error(self, seq, error):
+        """Clear the latest results and record an error, unless newer results are already published"""
+        with self.lock:
+            if seq < self.latest_seq:
+                return
+            self.latest_seq = seq
+            self.latest_detections = []
+            self.latest_error = error
 
     def _get_latest_detections(self):
         """Get the most recent detection results"""
@@ -260,7 +409,7 @@ class RemoteGroundingDinoDetector:
         Visualize detections on frame (compatible with backend.py)
 
         Args:
-            frame: RGB frame
+            frame: BGR frame (as returned by KinectCamera.get_frames)
             detections: List of detections
             show_3d: Whether to show 3D coordinates
 
@@ -302,12 +451,9 @@ class RemoteGroundingDinoDetector:
 
     def _get_color(self, class_name):
         """Generate consistent color for class name"""
-        np.random.seed(hash(class_name) % (2**32))
-        color = tuple(map(int, np.random.randint(50, 255, 3)))
-        return color
+        return _class_color(class_name)
 
     def __del__(self):
         """Cleanup"""
-        # Wait for any pending detection to finish
-        if hasattr(self, 'thread') and self.thread and self.thread.is_alive():
-            self.thread.join(timeout=2)
+        if hasattr(self, 'session'):
+            self.session.close()
@@ -22,6 +22,7 @@
  * - t:<angle> - Move tilt servo (vertical) to angle (e.g., "t:110")
  * - b:<pan>,<tilt> - Move both servos (e.g., "b:90,110")
  * - c - Return to center position (90°, 110°)
+ * - cal - Sweep pan 90° -> 0° -> 180° -> 90°, then print "CAL_DONE"
  *
  * Velocity-based (NEW):
  * - vp:<speed> - Set pan velocity in deg/sec (e.g., "vp:30" or "vp:-30")
@@ -88,6 +89,7 @@ void setup() {
   Serial.println("  t:<angle>       - Move tilt (90-180)");
   Serial.println("  b:<pan>,<tilt>  - Move both");
   Serial.println("  c               - Center (90, 110)");
+  Serial.println("  cal             - Calibration sweep (prints CAL_DONE)");
   Serial.println("");
   Serial.println("Velocity Commands:");
   Serial.println("  vp:<speed>      - Set pan velocity (deg/sec, +/- for direction)");
@@ -121,6 +123,9 @@ void processCommand(String input) {
   if (input == "c" || input == "C") {
     centerServos();
   }
+  else if (input == "cal" || input == "CAL") {
+    runCalibration();
+  }
   else if (input == "stop" || input == "STOP") {
     stopAll();
   }
@@ -236,3 +241,30 @@ void setPanVelocity(float velocity) {
   Serial.print(velocity);
   Serial.println(" deg/sec");
 }
+
+// Calibration sweep (blocking, 30ms per degree): 90 -> 0 -> 180 -> 90
+void sweepPanTo(int target) {
+  int pos = (int)panCurrentPos;
+  int step = (target > pos) ? 1 : -1;
+  while (pos != target) {
+    pos += step;
+    panServo.write(pos);
+    delay(30);
+  }
+  panCurrentPos = target;
+  panTargetPos = target;
+}
+
+void runCalibration() {
+  panVelocity = 0;
+  tiltVelocity = 0;
+  Serial.println("Calibrating pan...");
+  sweepPanTo(PAN_MIN);
+  delay(200);
+  sweepPanTo(PAN_MAX);
+  delay(200);
+  sweepPanTo(PAN_CENTER);
+  lastUpdateTime = millis();
+  // Completion sentinel the host blocks on instead of a fixed delay
+  Serial.println("CAL_DONE");
+}